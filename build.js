@@ -29,6 +29,7 @@ if (!fs.existsSync(pythonDistPath)) {
 // Copy all Python scripts
 const pythonFiles = [
     'cv_detection.py',
+    'cv_utils.py',
     'install_python.py',
     'requirements.txt'
 ];
@@ -9,93 +9,126 @@ import numpy as np
 import mss
 import logging
 import sys
+from cv_utils import find_purple_roi, label_components, trace_external_contour
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# HSV bounds for purple border shades (uint8, matching the HSV image)
+PURPLE_LOWER = np.array([125, 100, 100], dtype=np.uint8)
+PURPLE_UPPER = np.array([155, 255, 255], dtype=np.uint8)
+# Backup range - darker purple borders
+DARK_PURPLE_LOWER = np.array([135, 80, 80], dtype=np.uint8)
+DARK_PURPLE_UPPER = np.array([145, 255, 255], dtype=np.uint8)
+
 def detect_rectangular_purple_borders(image):
     """
     Detect complete rectangular purple borders around items.
     This approach looks for purple pixels that form complete rectangular outlines.
+    Accepts BGR images or BGRA screenshots (the alpha channel is ignored).
     """
-    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-    
-    # Focus on the specific purple color of borders
-    purple_ranges = [
-        # Primary range - bright purple borders
-        ([130, 120, 120], [150, 255, 255]),
-        # Secondary range - slightly different purple shades
-        ([125, 100, 100], [155, 255, 255]),
-        # Backup range - darker purple borders
-        ([135, 80, 80], [145, 255, 255])
-    ]
-    
-    combined_mask = np.zeros(hsv.shape[:2], dtype=np.uint8)
-    total_purple_pixels = 0
-    
-    for i, (lower, upper) in enumerate(purple_ranges):
-        lower = np.array(lower)
-        upper = np.array(upper)
-        mask = cv2.inRange(hsv, lower, upper)
-        
-        purple_pixel_count = np.sum(mask > 0)
-        logger.info(f"Purple range {i+1}: {purple_pixel_count} pixels")
-        total_purple_pixels += purple_pixel_count
-        
-        combined_mask = cv2.bitwise_or(combined_mask, mask)
+    combined_mask = np.zeros(image.shape[:2], dtype=np.uint8)
     
+    # Only convert the part of the image that can contain purple pixels
+    roi = find_purple_roi(image)
+    if roi is None:
+        logger.warning("No purple pixels detected!")
+        return [], combined_mask
+    
+    rx, ry, rw, rh = roi
+    hsv = cv2.cvtColor(image[ry:ry + rh, rx:rx + rw], cv2.COLOR_BGR2HSV)
+    
+    # Focus on the specific purple color of borders. The bright range
+    # ([130, 120, 120] - [150, 255, 255]) lies entirely inside the main range,
+    # so only the main and the darker backup range need their own pass.
+    # Main range - purple border shades
+    roi_mask = cv2.inRange(hsv, PURPLE_LOWER, PURPLE_UPPER)
+    # Backup range - darker purple borders
+    backup_mask = cv2.inRange(hsv, DARK_PURPLE_LOWER, DARK_PURPLE_UPPER)
+    cv2.bitwise_or(roi_mask, backup_mask, dst=roi_mask)
+    combined_mask[ry:ry + rh, rx:rx + rw] = roi_mask
+    
+    total_purple_pixels = cv2.countNonZero(roi_mask)
     logger.info(f"Total purple pixels: {total_purple_pixels}")
     
     if total_purple_pixels == 0:
         logger.warning("No purple pixels detected!")
-        return []
+        return [], combined_mask
+    
+    # A one-pixel outline enclosing the minimum area of 100 needs at least
+    # 2*sqrt(2*100) ~ 28 pixels, so sparser masks cannot hold a border
+    if total_purple_pixels < 28:
+        logger.info("Too few purple pixels for a border, skipping contour analysis")
+        return [], combined_mask
     
-    # Instead of complex morphological operations, let's find contours directly
-    # and then analyze them for border-like properties
-    contours, _ = cv2.findContours(combined_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    logger.info(f"Found {len(contours)} contours")
+    # Instead of complex morphological operations, label the purple components
+    # directly and then analyze them for border-like properties. Only the
+    # components that pass the bounding box filters get their contour traced.
+    labels, stats, outer = label_components(roi_mask)
+    logger.info(f"Found {len(stats)} components")
     
     detected_items = []
     
-    for i, contour in enumerate(contours):
+    # Per-contour diagnostics are only formatted when DEBUG logging is on
+    debug = logger.isEnabledFor(logging.DEBUG)
+    
+    # Geometry filters that only need the bounding box, done for all
+    # components at once so only the survivors reach the per-contour loop
+    rects = stats[:, :4]
+    widths, heights = rects[:, 2], rects[:, 3]
+    min_dimensions = np.minimum(widths, heights)
+    keep = (
+        # A contour traced through pixel centers encloses at most (w-1)*(h-1),
+        # so smaller boxes can never pass the minimum area of 100
+        ((widths - 1) * (heights - 1) >= 100) &
+        # Item borders in PoE2 are typically 1-3 pixels thick around a 20-200px item
+        (min_dimensions >= 20) & (min_dimensions <= 200) &
+        # Items can be various shapes - very lenient aspect ratio
+        # (0.2 <= w/h <= 5.0, compared in integers)
+        (heights <= 5 * widths) & (widths <= 5 * heights)
+    )
+    
+    if debug:
+        logger.debug(f"{np.count_nonzero(keep)} of {len(stats)} components passed size and aspect filters")
+    
+    for i in np.flatnonzero(keep).tolist():
+        contour = trace_external_contour(labels, outer, i + 1, rects[i], offset=(rx, ry))
+        if contour is None:
+            if debug:
+                logger.debug(f"Component {i}: nested inside another component, skipping")
+            continue
+        
         area = cv2.contourArea(contour)
         
         # Skip very small contours (noise)
-        if area < 100:  # Increased minimum area
-            logger.info(f"Contour {i}: area={area:.1f} - too small, skipping")
+        if area < 100:
+            if debug:
+                logger.debug(f"Component {i}: area={area:.1f} - too small, skipping")
             continue
         
-        # Get bounding rectangle
-        x, y, w, h = cv2.boundingRect(contour)
+        x, y, w, h = rects[i].tolist()
+        x += rx
+        y += ry
         aspect_ratio = w / h
         
         # Calculate how rectangular the contour is
-        rect_area = w * h
-        contour_rect_ratio = area / rect_area if rect_area > 0 else 0
+        contour_rect_ratio = area / (w * h)
         
-        logger.info(f"Contour {i}: area={area:.1f}, size=({w}x{h}), aspect={aspect_ratio:.2f}, rect_ratio={contour_rect_ratio:.2f}")
+        if debug:
+            logger.debug(f"Component {i}: area={area:.1f}, size=({w}x{h}), aspect={aspect_ratio:.2f}, rect_ratio={contour_rect_ratio:.2f}")
         
         # Check if this looks like a border vs a filled item
         # Borders should have relatively low area compared to their bounding box
         if contour_rect_ratio > 0.3:  # Much more strict - skip anything that's more than 30% filled
-            logger.info(f"  -> Skipped (appears to be a filled item: rect_ratio={contour_rect_ratio:.2f})")
-            continue
-        
-        # Check if it's a reasonable size for an item border
-        # Item borders in PoE2 are typically 1-3 pixels thick
-        min_dimension = min(w, h)
-        if min_dimension < 20:  # Too small for a reasonable item
-            logger.info(f"  -> Skipped (too small: {min_dimension}px)")
+            if debug:
+                logger.debug(f"  -> Skipped (appears to be a filled item: rect_ratio={contour_rect_ratio:.2f})")
             continue
         
-        if min_dimension > 200:  # Too large for a single item
-            logger.info(f"  -> Skipped (too large: {min_dimension}px)")
-            continue
-        
-        # Check aspect ratio - items can be various shapes
-        if not (0.2 <= aspect_ratio <= 5.0):  # Very lenient aspect ratio
-            logger.info(f"  -> Skipped (aspect ratio {aspect_ratio:.2f} not suitable)")
+        # Should be reasonably rectangular
+        if contour_rect_ratio < 0.05:  # Very lenient for borders
+            if debug:
+                logger.debug(f"  -> Skipped (not rectangular enough: {contour_rect_ratio:.2f})")
             continue
         
         # Additional check: analyze perimeter vs area to detect border-like structures
@@ -104,17 +137,14 @@ def detect_rectangular_purple_borders(image):
             area_perimeter_ratio = area / perimeter
             # Borders should have relatively low area-to-perimeter ratio (thin structures)
             if area_perimeter_ratio > 4.0:  # Skip thick/filled areas
-                logger.info(f"  -> Skipped (too thick for a border: area/perim={area_perimeter_ratio:.2f})")
+                if debug:
+                    logger.debug(f"  -> Skipped (too thick for a border: area/perim={area_perimeter_ratio:.2f})")
                 continue
-            logger.info(f"  -> Area/perimeter ratio: {area_perimeter_ratio:.2f}")
+            if debug:
+                logger.debug(f"  -> Area/perimeter ratio: {area_perimeter_ratio:.2f}")
         else:
             area_perimeter_ratio = 0
         
-        # Should be reasonably rectangular
-        if contour_rect_ratio < 0.05:  # Very lenient for borders
-            logger.info(f"  -> Skipped (not rectangular enough: {contour_rect_ratio:.2f})")
-            continue
-        
         # Calculate confidence heavily favoring border-like structures
         size_score = min(1.0, area / 1000.0)  # Prefer larger areas
         
@@ -129,7 +159,8 @@ def detect_rectangular_purple_borders(image):
         # Weight heavily toward border characteristics
         confidence = (size_score * 0.2 + border_score * 0.5 + shape_score * 0.2 + aspect_score * 0.1)
         
-        logger.info(f"  -> Confidence: {confidence:.3f} (size={size_score:.3f}, border={border_score:.3f}, shape={shape_score:.3f}, aspect={aspect_score:.3f})")
+        if debug:
+            logger.debug(f"  -> Confidence: {confidence:.3f} (size={size_score:.3f}, border={border_score:.3f}, shape={shape_score:.3f}, aspect={aspect_score:.3f})")
         
         # Accept items with reasonable confidence
         if confidence >= 0.3:
@@ -146,9 +177,11 @@ def detect_rectangular_purple_borders(image):
                 'center_y': y + h // 2
             }
             detected_items.append(detected_item)
-            logger.info(f"  -> DETECTED: {detected_item}")
+            if debug:
+                logger.debug(f"  -> DETECTED: {detected_item}")
         else:
-            logger.info(f"  -> Skipped (confidence {confidence:.3f} too low)")
+            if debug:
+                logger.debug(f"  -> Skipped (confidence {confidence:.3f} too low)")
     
     return detected_items, combined_mask
 
@@ -163,8 +196,9 @@ def main():
     with mss.mss() as sct:
         monitor = {"top": y, "left": x, "width": width, "height": height}
         screenshot = sct.grab(monitor)
-        image = np.array(screenshot)
-        image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+        # View the BGRA pixels in place; detection converts straight to HSV
+        image = np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(
+            screenshot.height, screenshot.width, 4)
     
     logger.info(f"Screenshot captured: {image.shape}")
     
@@ -189,12 +223,16 @@ def main():
         logger.info("NO purple-bordered items found")
         logger.info("=" * 50)
     
-    # Save debug images
-    cv2.imwrite("debug_original_v2.png", image)
+    # Save debug images (only with --debug). The color images are JPEG since
+    # PNG's deflate is far slower for full color frames; the mask stays PNG.
+    if "--debug" not in sys.argv:
+        return
+    
+    cv2.imwrite("debug_original_v2.jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 85])
     cv2.imwrite("debug_mask_v2.png", mask)
     
-    # Create overlay image
-    overlay = image.copy()
+    # Create overlay image (BGR, so drawn colors stay opaque)
+    overlay = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
     for item in detected_items:
         cv2.rectangle(overlay, (item['x'], item['y']), 
                      (item['x'] + item['width'], item['y'] + item['height']), 
@@ -202,8 +240,8 @@ def main():
         cv2.putText(overlay, f"Conf: {item['confidence']:.2f}", 
                    (item['x'], item['y'] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
     
-    cv2.imwrite("debug_overlay_v2.png", overlay)
-    logger.info("Debug images saved: debug_original_v2.png, debug_mask_v2.png, debug_overlay_v2.png")
+    cv2.imwrite("debug_overlay_v2.jpg", overlay, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    logger.info("Debug images saved: debug_original_v2.jpg, debug_mask_v2.png, debug_overlay_v2.jpg")
 
 if __name__ == "__main__":
     main()
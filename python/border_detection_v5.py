@@ -6,20 +6,31 @@ Focuses specifically on detecting square/rectangular purple borders using shape
 
 import cv2
 import numpy as np
-import pyautogui
+import mss
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import logging
+from cv_utils import find_purple_roi, find_candidate_regions, drop_components_below
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# CUDA is only usable with a CUDA-enabled OpenCV build (opencv-contrib-python
+# built with CUDA) and an NVIDIA device; the pip wheels report no devices
+try:
+    CUDA_AVAILABLE = cv2.cuda.getCudaEnabledDeviceCount() > 0
+except (AttributeError, cv2.error):
+    CUDA_AVAILABLE = False
+
 class RectangleBorderDetector:
     def __init__(self):
         # HSV ranges for purple detection (from reference app)
-        self.purple_lower = np.array([125, 50, 50])
-        self.purple_upper = np.array([155, 255, 255])
+        self.purple_lower = np.array([125, 50, 50], dtype=np.uint8)
+        self.purple_upper = np.array([155, 255, 255], dtype=np.uint8)
         
         # Detection parameters
         self.min_area = 300  # Lower minimum area
@@ -41,28 +52,144 @@ class RectangleBorderDetector:
         ]
         self.aspect_ratio_tolerance = 0.15  # 15% tolerance around target ratios
         
+        # Acceptance interval and descriptive name for each PoE2 ratio, built once
+        ratio_names = {
+            0.25: "Tall Skinny Rectangle",
+            0.5: "Taller Rectangle", 
+            0.667: "Tall Rectangle",
+            1.0: "Square",
+            2.0: "Wide Rectangle"
+        }
+        self._aspect_ranges = [
+            (target_ratio * (1 - self.aspect_ratio_tolerance),
+             target_ratio * (1 + self.aspect_ratio_tolerance),
+             ratio_names.get(target_ratio, f"Ratio {target_ratio}"))
+            for target_ratio in self.poe2_aspect_ratios
+        ]
+        # Envelope of all the intervals; ratios outside it can never match
+        self._aspect_envelope = (min(r[0] for r in self._aspect_ranges),
+                                 max(r[1] for r in self._aspect_ranges))
+        
+        # Every contour that survives detect_rectangle_contours has exactly 4
+        # vertices and a matched PoE2 ratio, so its confidence is a constant:
+        # high aspect confidence (0.9-1.0) weighted 0.7 plus a perfect vertex
+        # score weighted 0.3
+        aspect_confidence = 0.9 + (0.1 * (1 - self.aspect_ratio_tolerance))
+        self._rectangle_confidence = min(1.0, max(0.0, aspect_confidence * 0.7 + 1.0 * 0.3))
+        
         # Merchant window coordinates (from our UI config)
         self.merchant_x = 834
         self.merchant_y = 284
         self.merchant_width = 875
         self.merchant_height = 867
         
-        # Debug mode
-        self.debug_mode = True
+        # Screen grabber, created on first capture and reused across frames
+        self._sct = None
+        self._monitor = {
+            "top": self.merchant_y,
+            "left": self.merchant_x,
+            "width": self.merchant_width,
+            "height": self.merchant_height
+        }
+        
+        # Debug mode: writes the intermediate masks and logs progress at INFO
+        # (main() enables it; per-contour diagnostics need DEBUG logging)
+        self.debug_mode = False
+        
+        # Run the HSV conversion and inRange on the GPU (main() enables it with
+        # --cuda when CUDA_AVAILABLE); contours are always found on the CPU
+        self.use_cuda = False
+        self._gpu_frame = None
+        
+        # HSV buffer reused across frames (allocated on first frame)
+        self._hsv_buf = None
+        
+        # Last captured frame, reused by create_debug_visualization
+        self._last_frame = None
+        
+        # Debug images are encoded on one worker thread, off the detection path
+        self._io_pool = ThreadPoolExecutor(max_workers=1)
+        
+        # Background capture (see start_capture_thread); _frame_ready is set
+        # when a frame newer than the last one handed out is published
+        self._capture_thread = None
+        self._capture_stop = threading.Event()
+        self._frame_lock = threading.Lock()
+        self._frame_ready = threading.Event()
+        self._latest_frame = None
+        
+    def start_capture_thread(self, interval=0.033):
+        """
+        Keep grabbing the merchant region in a background thread so a polling
+        loop can detect on the latest frame while the next one is captured.
+        mss and OpenCV release the GIL while they work, so the two overlap.
+        This is opt-in for callers that poll detect_purple_borders; main()
+        runs a single detection and does not start it.
+        """
+        if self._capture_thread is not None:
+            return
+        
+        self._capture_stop.clear()
+        self._frame_ready.clear()
+        self._latest_frame = None
+        self._capture_thread = threading.Thread(target=self._capture_loop, args=(interval,), daemon=True)
+        self._capture_thread.start()
+    
+    def stop_capture_thread(self):
+        """Stop the background capture thread, if running"""
+        thread = self._capture_thread
+        if thread is None:
+            return
         
+        self._capture_stop.set()
+        thread.join()
+    
+    def _capture_loop(self, interval):
+        """Background capture loop started by start_capture_thread"""
+        try:
+            # mss instances must not be shared between threads, so this one is private
+            with mss.mss() as sct:
+                while not self._capture_stop.is_set():
+                    screenshot = sct.grab(self._monitor)
+                    # Every grab has its own buffer, so a published frame is never
+                    # written again and readers can use it without copying
+                    frame = np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(
+                        screenshot.height, screenshot.width, 4)
+                    with self._frame_lock:
+                        self._latest_frame = frame
+                        self._frame_ready.set()
+                    self._capture_stop.wait(interval)
+        except Exception as e:
+            logger.error(f"Background capture failed: {e}")
+        finally:
+            # Never leave a stale frame behind: capture_merchant_region grabs
+            # directly again once the thread is gone. Setting _frame_ready wakes
+            # a caller waiting for a frame that will not come.
+            with self._frame_lock:
+                self._latest_frame = None
+                self._capture_thread = None
+                self._frame_ready.set()
+    
     def capture_merchant_region(self):
-        """Capture the merchant window region"""
+        """Capture the merchant window region (BGRA)"""
+        # Use the background thread's next frame when it is running, waiting
+        # until one newer than the last frame handed out is published
+        if self._capture_thread is not None and self._frame_ready.wait(timeout=1.0):
+            with self._frame_lock:
+                frame = self._latest_frame
+                self._frame_ready.clear()
+            if frame is not None:
+                return frame
+        
         try:
-            # Capture the merchant window region
-            screenshot = pyautogui.screenshot(region=(
-                self.merchant_x, 
-                self.merchant_y, 
-                self.merchant_width, 
-                self.merchant_height
-            ))
+            # Grab only the merchant window with mss instead of a PIL screenshot
+            if self._sct is None:
+                self._sct = mss.mss()
             
-            # Convert PIL to OpenCV format
-            image = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
+            screenshot = self._sct.grab(self._monitor)
+            # View the BGRA pixels in place; HSV conversion reads BGRA directly
+            image = np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(
+                screenshot.height, screenshot.width, 4)
             
             if self.debug_mode:
                 logger.info(f"Screenshot captured: {image.shape}")
@@ -74,49 +201,90 @@ class RectangleBorderDetector:
             return None
     
     def preprocess_image(self, image):
-        """Convert to HSV and create purple mask"""
-        # Convert to HSV for better color detection
-        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-        
-        # Create purple mask
-        purple_mask = cv2.inRange(hsv, self.purple_lower, self.purple_upper)
+        """Convert to HSV and create purple mask (accepts BGR or BGRA)"""
+        purple_mask = np.zeros(image.shape[:2], dtype=np.uint8)
+        
+        # Only convert the part of the image that can contain purple pixels,
+        # into a buffer reused across frames
+        roi = find_purple_roi(image)
+        if roi is not None:
+            rx, ry, rw, rh = roi
+            if self.use_cuda:
+                # Upload only the ROI and download only the finished mask
+                if self._gpu_frame is None:
+                    self._gpu_frame = cv2.cuda_GpuMat()
+                self._gpu_frame.upload(np.ascontiguousarray(image[ry:ry + rh, rx:rx + rw]))
+                gpu_hsv = cv2.cuda.cvtColor(self._gpu_frame, cv2.COLOR_BGR2HSV)
+                gpu_mask = cv2.cuda.inRange(gpu_hsv, tuple(self.purple_lower.tolist()),
+                                            tuple(self.purple_upper.tolist()))
+                purple_mask[ry:ry + rh, rx:rx + rw] = gpu_mask.download()
+            else:
+                if self._hsv_buf is None or self._hsv_buf.shape[:2] != image.shape[:2]:
+                    self._hsv_buf = np.empty(image.shape[:2] + (3,), dtype=np.uint8)
+                hsv = cv2.cvtColor(image[ry:ry + rh, rx:rx + rw], cv2.COLOR_BGR2HSV,
+                                   dst=self._hsv_buf[:rh, :rw])
+                
+                # Create purple mask
+                cv2.inRange(hsv, self.purple_lower, self.purple_upper,
+                            dst=purple_mask[ry:ry + rh, rx:rx + rw])
         
         if self.debug_mode:
             logger.info(f"Purple mask created: {purple_mask.shape}")
             # Save mask for debugging
-            cv2.imwrite("debug_v5_purple_mask.png", purple_mask)
+            self.save_debug_image("debug_v5_purple_mask.png", purple_mask)
             
         return purple_mask
     
     def clean_mask(self, mask):
-        """Apply morphological operations to clean up the mask"""
-        # Small kernel for gentle cleaning
-        kernel = np.ones((2, 2), np.uint8)
+        """Remove connected components too small to hold a border of min_area"""
+        cleaned_mask = np.zeros_like(mask)
+        
+        # A coarse pass at half resolution finds the regions that can hold a
+        # border, so only those are labelled at full resolution. On dense masks
+        # the pooled noise joins into one region anyway, so label it all at once.
+        if cv2.countNonZero(mask) * 10 > mask.size:
+            regions = [(0, 0, mask.shape[1], mask.shape[0])]
+        else:
+            regions = find_candidate_regions(mask, self.min_area)
         
-        # Close small gaps in the mask
-        cleaned_mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+        for x, y, w, h in regions:
+            cleaned_mask[y:y + h, x:x + w] = drop_components_below(mask[y:y + h, x:x + w], self.min_area)
         
         if self.debug_mode:
-            cv2.imwrite("debug_v5_cleaned_mask.png", cleaned_mask)
+            self.save_debug_image("debug_v5_cleaned_mask.png", cleaned_mask)
             
         return cleaned_mask
     
+    def save_debug_image(self, path, image):
+        """
+        Write a debug image in the background. The images passed in are built
+        fresh for each frame and not modified afterwards, so no copy is needed.
+        Failed writes are logged once they finish; flush_debug_images waits
+        for the queued ones.
+        """
+        write = self._io_pool.submit(cv2.imwrite, path, image)
+        write.add_done_callback(lambda write: self._report_debug_write(path, write))
+    
+    def _report_debug_write(self, path, write):
+        """Log the outcome of a background debug image write"""
+        try:
+            if not write.result():
+                logger.error(f"Failed to write {path}")
+            elif self.debug_mode:
+                logger.info(f"Saved {path}")
+        except Exception as e:
+            logger.error(f"Failed to write {path}: {e}")
+    
+    def flush_debug_images(self):
+        """Wait for the queued debug image writes and stop the writer thread"""
+        self._io_pool.shutdown(wait=True)
+    
     def check_poe2_aspect_ratio(self, aspect_ratio):
         """Check if aspect ratio matches any PoE2 item border ratio"""
-        for target_ratio in self.poe2_aspect_ratios:
-            min_ratio = target_ratio * (1 - self.aspect_ratio_tolerance)
-            max_ratio = target_ratio * (1 + self.aspect_ratio_tolerance)
-            
+        for min_ratio, max_ratio, name in self._aspect_ranges:
             if min_ratio <= aspect_ratio <= max_ratio:
                 # Return descriptive name for the matched ratio
-                ratio_names = {
-                    0.25: "Tall Skinny Rectangle",
-                    0.5: "Taller Rectangle", 
-                    0.667: "Tall Rectangle",
-                    1.0: "Square",
-                    2.0: "Wide Rectangle"
-                }
-                return ratio_names.get(target_ratio, f"Ratio {target_ratio}")
+                return name
         
         return None
     
@@ -130,49 +298,69 @@ class RectangleBorderDetector:
         
         rectangle_contours = []
         
+        # Per-contour diagnostics are only formatted when DEBUG logging is on
+        debug = logger.isEnabledFor(logging.DEBUG)
+        
         for i, contour in enumerate(contours):
+            # Cheapest checks first: the bounding rectangle gives the aspect
+            # ratio and an upper bound on the enclosed area, so most contours
+            # are rejected before contourArea and approxPolyDP run
+            x, y, w, h = cv2.boundingRect(contour)
+            
+            # A contour through pixel centers encloses at most (w-1)*(h-1)
+            if (w - 1) * (h - 1) < self.min_area:
+                if debug:
+                    logger.debug(f"Contour {i}: Bounding box {w}x{h} too small for area {self.min_area}")
+                continue
+            
+            # Calculate aspect ratio and check if it matches PoE2 item border ratios,
+            # rejecting thin strips outside every interval straight away
+            aspect_ratio = w / h
+            if not (self._aspect_envelope[0] <= aspect_ratio <= self._aspect_envelope[1]):
+                if debug:
+                    logger.debug(f"Contour {i}: Aspect ratio {aspect_ratio:.3f} outside PoE2 range "
+                                 f"[{self._aspect_envelope[0]:.3f}, {self._aspect_envelope[1]:.3f}]")
+                continue
+            matched_ratio = self.check_poe2_aspect_ratio(aspect_ratio)
+            
+            if not matched_ratio:
+                if debug:
+                    logger.debug(f"Contour {i}: Aspect ratio {aspect_ratio:.3f} doesn't match PoE2 item ratios")
+                continue
+            
+            if debug:
+                logger.debug(f"Contour {i}: Aspect ratio {aspect_ratio:.3f} - MATCHES PoE2 {matched_ratio}")
+            
             area = cv2.contourArea(contour)
             
             # Filter by area
             if area < self.min_area or area > self.max_area:
-                if self.debug_mode:
+                if debug:
                     logger.debug(f"Contour {i}: Area {area:.0f} outside range [{self.min_area}, {self.max_area}]")
                 continue
             
-            if self.debug_mode:
-                logger.info(f"Contour {i}: Area {area:.0f} - PASSED area filter")
+            if debug:
+                logger.debug(f"Contour {i}: Area {area:.0f} - PASSED area filter")
             
-            # Approximate the contour to a polygon
+            # Approximate the contour to a polygon (only for contours that passed
+            # the cheaper filters; Douglas-Peucker is the expensive step)
             epsilon = self.epsilon_factor * cv2.arcLength(contour, True)
             approx = cv2.approxPolyDP(contour, epsilon, True)
             
             # Check if it's exactly 4 vertices (rectangular)
+            # _rectangle_confidence assumes exactly 4 vertices and a matched ratio;
+            # update it if this check changes
             num_vertices = len(approx)
             if num_vertices != 4:
-                if self.debug_mode:
+                if debug:
                     logger.debug(f"Contour {i}: {num_vertices} vertices (need exactly 4 for rectangles)")
                 continue
             
-            if self.debug_mode:
-                logger.info(f"Contour {i}: Exactly 4 vertices - PASSED rectangular filter")
-            
-            # Get bounding rectangle
-            x, y, w, h = cv2.boundingRect(contour)
-            
-            # Calculate aspect ratio and check if it matches PoE2 item border ratios
-            aspect_ratio = w / h
-            matched_ratio = self.check_poe2_aspect_ratio(aspect_ratio)
-            
-            if not matched_ratio:
-                if self.debug_mode:
-                    logger.debug(f"Contour {i}: Aspect ratio {aspect_ratio:.3f} doesn't match PoE2 item ratios")
-                continue
-            
-            if self.debug_mode:
-                logger.info(f"Contour {i}: Aspect ratio {aspect_ratio:.3f} - MATCHES PoE2 {matched_ratio}")
+            if debug:
+                logger.debug(f"Contour {i}: Exactly 4 vertices - PASSED rectangular filter")
             
             # Additional rectangle verification
-            if self.is_rectangle_like(approx, contour):
+            if self.is_rectangle_like(approx, area, (x, y, w, h)):
                 rectangle_contours.append({
                     'contour': contour,
                     'approx': approx,
@@ -182,91 +370,73 @@ class RectangleBorderDetector:
                     'vertices': num_vertices
                 })
                 
-                if self.debug_mode:
-                    logger.info(f"✅ Contour {i}: Rectangle-like! Area={area:.0f}, AR={aspect_ratio:.2f}, Vertices={num_vertices}")
+                if debug:
+                    logger.debug(f"✅ Contour {i}: Rectangle-like! Area={area:.0f}, AR={aspect_ratio:.2f}, Vertices={num_vertices}")
             else:
-                if self.debug_mode:
-                    logger.info(f"❌ Contour {i}: FAILED rectangle-like verification")
+                if debug:
+                    logger.debug(f"❌ Contour {i}: FAILED rectangle-like verification")
         
         return rectangle_contours
     
-    def is_rectangle_like(self, approx, contour):
-        """Additional verification that the contour is rectangular-like (squares, tall rectangles, wide rectangles)"""
+    def is_rectangle_like(self, approx, area, bbox):
+        """
+        Additional verification that the contour is rectangular-like (squares, tall rectangles, wide rectangles).
+        approx is its polygon approximation; area and bbox are its area and bounding
+        rectangle, already computed by the caller.
+        """
+        debug = logger.isEnabledFor(logging.DEBUG)
         try:
             # More lenient approach - just check basic rectangular properties
             if len(approx) >= 3:  # At least triangle
                 
                 # Calculate contour area vs bounding rectangle area
-                contour_area = cv2.contourArea(contour)
-                x, y, w, h = cv2.boundingRect(contour)
+                _, _, w, h = bbox
                 rect_area = w * h
                 
                 if rect_area > 0:
-                    area_ratio = contour_area / rect_area
+                    area_ratio = area / rect_area
                     
                     # For rectangular shapes, this ratio should be reasonable
                     # (not too low - meaning very irregular shape)
                     if area_ratio < 0.3:  # Too irregular
-                        if self.debug_mode:
+                        if debug:
                             logger.debug(f"Area ratio {area_ratio:.2f} too low (irregular shape)")
                         return False
                 
                 # If we have 4+ vertices, do some basic angle checking
                 if len(approx) >= 4:
-                    # Check a few key angles (don't need to be perfect 90°)
-                    angles = []
-                    for i in range(min(4, len(approx))):  # Check first 4 angles
-                        p1 = approx[i][0]
-                        p2 = approx[(i + 1) % len(approx)][0]
-                        p3 = approx[(i + 2) % len(approx)][0]
-                        
-                        # Calculate angle at p2
-                        v1 = p1 - p2
-                        v2 = p3 - p2
-                        
-                        if np.linalg.norm(v1) > 0 and np.linalg.norm(v2) > 0:
-                            cos_angle = np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2))
-                            cos_angle = np.clip(cos_angle, -1.0, 1.0)
-                            angle = np.arccos(cos_angle) * 180 / np.pi
-                            angles.append(angle)
+                    # Check a few key angles (don't need to be perfect 90°),
+                    # all at once: the angle at p2 between p1 and p3 for the
+                    # first 4 consecutive vertex triples
+                    points = approx[:, 0, :].astype(np.float64)
+                    idx = np.arange(min(4, len(points)))
+                    p1 = points[idx]
+                    p2 = points[(idx + 1) % len(points)]
+                    p3 = points[(idx + 2) % len(points)]
+                    v1 = p1 - p2
+                    v2 = p3 - p2
+                    
+                    norms1 = np.sqrt((v1 * v1).sum(axis=1))
+                    norms2 = np.sqrt((v2 * v2).sum(axis=1))
+                    valid = (norms1 > 0) & (norms2 > 0)
+                    cos_angles = (v1 * v2).sum(axis=1)[valid] / (norms1[valid] * norms2[valid])
+                    angles = np.arccos(np.clip(cos_angles, -1.0, 1.0)) * 180 / np.pi
                     
                     if len(angles) > 0:
                         # Check if angles are reasonable (not too acute or obtuse)
-                        extreme_angles = [a for a in angles if a < 45 or a > 135]
+                        extreme_angles = angles[(angles < 45) | (angles > 135)]
                         if len(extreme_angles) > len(angles) * 0.5:  # More than half are extreme
-                            if self.debug_mode:
-                                logger.debug(f"Too many extreme angles: {extreme_angles}")
+                            if debug:
+                                logger.debug(f"Too many extreme angles: {extreme_angles.tolist()}")
                             return False
             
             return True
             
         except Exception as e:
-            if self.debug_mode:
+            if debug:
                 logger.debug(f"Error in rectangular verification: {e}")
             return False
     
-    def calculate_confidence(self, contour_data):
-        """Calculate confidence score for a detected PoE2 rectangle border"""
-        aspect_ratio = contour_data['aspect_ratio']
-        vertices = contour_data['vertices']
-        
-        # PoE2 aspect ratio confidence (bonus for exact matches)
-        matched_ratio = self.check_poe2_aspect_ratio(aspect_ratio)
-        if matched_ratio:
-            # Give high confidence for PoE2 ratio matches
-            aspect_confidence = 0.9 + (0.1 * (1 - self.aspect_ratio_tolerance))  # 0.9-1.0
-        else:
-            # Lower confidence for non-PoE2 ratios
-            aspect_confidence = 0.3
-        
-        # Vertex count confidence (exactly 4 vertices = perfect score)
-        vertex_confidence = 1.0 if vertices == 4 else 0.0
-        
-        # Combined confidence (focus on aspect ratio and vertices only)
-        confidence = (aspect_confidence * 0.7 + vertex_confidence * 0.3)
-        
-        return min(1.0, max(0.0, confidence))
-    
     def detect_purple_borders(self):
         """Main detection function"""
         logger.info("🔍 Starting V5 PoE2 rectangle border detection...")
@@ -275,6 +445,7 @@ class RectangleBorderDetector:
         image = self.capture_merchant_region()
         if image is None:
             return []
+        self._last_frame = image
         
         # Preprocess
         purple_mask = self.preprocess_image(image)
@@ -287,36 +458,39 @@ class RectangleBorderDetector:
             logger.info("❌ No rectangle-like purple borders found")
             return []
         
-        # Calculate confidence and filter
+        # Confidence is the same for every rectangle contour (see __init__)
+        confidence = self._rectangle_confidence
+        if confidence < self.confidence_threshold:
+            logger.info("❌ Rectangle confidence is below the threshold")
+            return []
+        
         detected_items = []
         for contour_data in rectangle_contours:
-            confidence = self.calculate_confidence(contour_data)
+            x, y, w, h = contour_data['bbox']
             
-            if confidence >= self.confidence_threshold:
-                x, y, w, h = contour_data['bbox']
-                
-                # Convert to absolute coordinates
-                abs_x = self.merchant_x + x
-                abs_y = self.merchant_y + y
-                center_x = abs_x + w // 2
-                center_y = abs_y + h // 2
-                
-                item = {
-                    'x': center_x,
-                    'y': center_y,
-                    'width': w,
-                    'height': h,
-                    'area': contour_data['area'],
-                    'confidence': confidence,
-                    'aspect_ratio': contour_data['aspect_ratio'],
-                    'vertices': contour_data['vertices'],
-                    'region': (abs_x, abs_y, w, h)
-                }
-                
-                detected_items.append(item)
-                
-                logger.info(f"✅ Detected rectangle border: ({center_x}, {center_y}) - Confidence: {confidence:.2f}")
-                logger.info(f"   Size: {w}x{h}, Area: {contour_data['area']:.0f}, Vertices: {contour_data['vertices']}")
+            # Convert to absolute coordinates
+            abs_x = self.merchant_x + x
+            abs_y = self.merchant_y + y
+            center_x = abs_x + w // 2
+            center_y = abs_y + h // 2
+            
+            item = {
+                'x': center_x,
+                'y': center_y,
+                'width': w,
+                'height': h,
+                'area': contour_data['area'],
+                'confidence': confidence,
+                'aspect_ratio': contour_data['aspect_ratio'],
+                'vertices': contour_data['vertices'],
+                'region': (abs_x, abs_y, w, h),
+                'local_region': (x, y, w, h)
+            }
+            
+            detected_items.append(item)
+            
+            logger.info(f"✅ Detected rectangle border: ({center_x}, {center_y}) - Confidence: {confidence:.2f}")
+            logger.info(f"   Size: {w}x{h}, Area: {contour_data['area']:.0f}, Vertices: {contour_data['vertices']}")
         
         # Sort by confidence
         detected_items.sort(key=lambda x: x['confidence'], reverse=True)
@@ -327,37 +501,48 @@ class RectangleBorderDetector:
     
     def create_debug_visualization(self, detected_items):
         """Create a debug visualization showing detected rectangles"""
-        image = self.capture_merchant_region()
+        # Draw on the frame the items were detected in rather than a new capture
+        image = self._last_frame
         if image is None:
-            return
-        
-        # Draw detected rectangles
-        for i, item in enumerate(detected_items):
-            x, y, w, h = item['region']
-            confidence = item['confidence']
-            
-            # Draw rectangle
+            image = self.capture_merchant_region()
+            if image is None:
+                return
+        
+        # Draw on a BGR copy so the drawn colors stay opaque
+        image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+        
+        # Draw all rectangles with one polylines call per color, using the
+        # window-relative boxes stored by detect_purple_borders
+        boxes = np.array([item['local_region'] for item in detected_items], dtype=np.int32).reshape(-1, 4)
+        x0, y0 = boxes[:, 0], boxes[:, 1]
+        x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+        corners = np.stack([x0, y0, x1, y0, x1, y1, x0, y1], axis=1).reshape(-1, 4, 2)
+        confident = np.array([item['confidence'] > 0.8 for item in detected_items], dtype=bool)
+        for selected, color in ((confident, (0, 255, 0)), (~confident, (0, 255, 255))):
+            if selected.any():
+                cv2.polylines(image, corners[selected], True, color, 2)
+        
+        # Labels and center points
+        for i, (x, y, w, h) in enumerate(boxes.tolist()):
+            confidence = detected_items[i]['confidence']
             color = (0, 255, 0) if confidence > 0.8 else (0, 255, 255)
-            cv2.rectangle(image, (x - self.merchant_x, y - self.merchant_y), 
-                         (x + w - self.merchant_x, y + h - self.merchant_y), color, 2)
-            
-            # Add label
-            label = f"#{i+1}: {confidence:.2f}"
-            cv2.putText(image, label, (x - self.merchant_x, y - self.merchant_y - 10), 
+            cv2.putText(image, f"#{i+1}: {confidence:.2f}", (x, y - 10), 
                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-            
-            # Add center point
-            center_x = x - self.merchant_x + w // 2
-            center_y = y - self.merchant_y + h // 2
-            cv2.circle(image, (center_x, center_y), 3, (255, 0, 0), -1)
+            cv2.circle(image, (x + w // 2, y + h // 2), 3, (255, 0, 0), -1)
         
         # Save debug image
-        cv2.imwrite("debug_v5_detected_rectangles.png", image)
-        logger.info("🔍 Debug visualization saved: debug_v5_detected_rectangles.png")
+        self.save_debug_image("debug_v5_detected_rectangles.png", image)
+        logger.info("🔍 Debug visualization queued: debug_v5_detected_rectangles.png")
 
 def main():
     """Test the V5 rectangle border detection"""
     detector = RectangleBorderDetector()
+    detector.debug_mode = True
+    if "--cuda" in sys.argv:
+        if CUDA_AVAILABLE:
+            detector.use_cuda = True
+        else:
+            logger.warning("No CUDA device available to OpenCV, running on the CPU")
     
     logger.info("🧪 Testing V5 PoE2 Rectangle Border Detection")
     logger.info("=" * 50)
@@ -383,6 +568,7 @@ def main():
     else:
         logger.info("❌ No PoE2 rectangle purple borders detected")
     
+    detector.flush_debug_images()
     logger.info("=" * 50)
     logger.info("V5 detection test complete")
 
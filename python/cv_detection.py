@@ -7,17 +7,42 @@ Detects purple-bordered items in merchant windows using OpenCV
 import cv2
 import numpy as np
 import json
+import math
+import random
 import sys
 import time
+import traceback
 import threading
 from typing import List, Dict, Tuple, Optional
 import logging
+import mss
 import pyautogui
+from cv_utils import find_candidate_regions, drop_components_below
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Messages to the Node.js parent are newline-delimited JSON (PythonShell json
+# mode). Both the detection thread and the command loop send them, so each
+# message is written as one complete line under a lock.
+_json_encoder = json.JSONEncoder(separators=(',', ':'))
+_stdout_lock = threading.Lock()
+
+def send_message(message: Dict):
+    """Write one JSON message line to stdout and flush it"""
+    line = _json_encoder.encode(message) + '\n'
+    with _stdout_lock:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+def mask_has_pixels(mask: np.ndarray) -> bool:
+    """Check if a mask has any non-zero pixel, stopping at the first one when
+    OpenCV provides hasNonZero (4.8+)"""
+    if hasattr(cv2, 'hasNonZero'):
+        return cv2.hasNonZero(mask)
+    return cv2.countNonZero(mask) > 0
+
 class ItemDetector:
     def __init__(self):
         self.config = {
@@ -28,15 +53,19 @@ class ItemDetector:
             'min_area': 300,  # V5 optimized
             'max_area': 100000,
             'mouse_speed': 1.0,
-            'click_modifiers': ['ctrl']
+            'click_modifiers': ['ctrl'],
+            'debug_images': False  # Write debug PNGs after every detection
         }
         self.is_detecting = False
         self.detection_thread = None
         self.stop_detection = False
         
         # V5 Purple color range in HSV (from reference app)
-        self.purple_lower = np.array([125, 50, 50])
-        self.purple_upper = np.array([155, 255, 255])
+        self.purple_lower = np.array([125, 50, 50], dtype=np.uint8)
+        self.purple_upper = np.array([155, 255, 255], dtype=np.uint8)
+        
+        # Morphology kernel
+        self._kernel = np.ones((2, 2), np.uint8)
         
         # V5 Rectangle detection parameters
         self.epsilon_factor = 0.02
@@ -47,70 +76,88 @@ class ItemDetector:
         self.poe2_aspect_ratios = [0.25, 0.5, 0.667, 1.0, 2.0]
         self.aspect_ratio_tolerance = 0.15
         
+        # Acceptance interval and descriptive name for each PoE2 ratio, built once
+        ratio_names = {
+            0.25: "Tall Skinny Rectangle",
+            0.5: "Taller Rectangle", 
+            0.667: "Tall Rectangle",
+            1.0: "Square",
+            2.0: "Wide Rectangle"
+        }
+        self._aspect_ranges = [
+            (target_ratio * (1 - self.aspect_ratio_tolerance),
+             target_ratio * (1 + self.aspect_ratio_tolerance),
+             ratio_names.get(target_ratio, f"Ratio {target_ratio}"))
+            for target_ratio in self.poe2_aspect_ratios
+        ]
+        
+        # Confidence of every accepted contour (derivation in border_detection_v5.py)
+        aspect_confidence = 0.9 + (0.1 * (1 - self.aspect_ratio_tolerance))
+        self._rectangle_confidence = min(1.0, max(0.0, aspect_confidence * 0.7 + 1.0 * 0.3))
+        
+        # Per-thread mss instance, plus the BGR frame buffer and the HSV, mask
+        # and overlay buffers reused across frames of the same size; captures
+        # and detections happen both on the detection thread and on the stdin
+        # command thread
+        self._capture_local = threading.local()
+        
+        # Last frame the detection loop ran on, to skip repeats
+        self._previous_frame = None
+        
+        # Latest frame from the background capture thread used by the detection
+        # loop, so the next capture overlaps detection on the current one
+        self._capture_thread = None
+        self._capture_stop = threading.Event()
+        self._frame_lock = threading.Lock()
+        self._frame_ready = threading.Event()
+        self._latest_frame = None
+        
         # Configure PyAutoGUI
         pyautogui.FAILSAFE = True
         pyautogui.PAUSE = 0.1
         
+        self._cache_detection_config()
+        
         logger.info("ItemDetector initialized with V5 algorithm")
 
     def update_config(self, new_config: Dict):
         """Update detection configuration"""
         self.config.update(new_config)
+        self._cache_detection_config()
+        # New settings can change the result for an unchanged frame
+        self._previous_frame = None
         logger.info(f"Configuration updated: {self.config}")
+        logger.info(f"V5 Detection config: confidence={self._confidence_threshold}, min_area={self._min_area}, max_area={self._max_area}")
+    
+    def _cache_detection_config(self):
+        """Copy the detection thresholds out of the config dict, so a frame does
+        not look them up again"""
+        self._confidence_threshold = self.config.get('confidence_threshold', 0.4)
+        self._min_area = self.config.get('min_area', 300)
+        self._max_area = self.config.get('max_area', 100000)
     
     def check_poe2_aspect_ratio(self, aspect_ratio: float) -> Optional[str]:
         """Check if aspect ratio matches any PoE2 item border ratio"""
-        for target_ratio in self.poe2_aspect_ratios:
-            min_ratio = target_ratio * (1 - self.aspect_ratio_tolerance)
-            max_ratio = target_ratio * (1 + self.aspect_ratio_tolerance)
-            
+        for min_ratio, max_ratio, name in self._aspect_ranges:
             if min_ratio <= aspect_ratio <= max_ratio:
-                ratio_names = {
-                    0.25: "Tall Skinny Rectangle",
-                    0.5: "Taller Rectangle", 
-                    0.667: "Tall Rectangle",
-                    1.0: "Square",
-                    2.0: "Wide Rectangle"
-                }
-                return ratio_names.get(target_ratio, f"Ratio {target_ratio}")
+                return name
         
         return None
     
-    def calculate_confidence(self, contour_data: Dict) -> float:
-        """Calculate confidence score for a detected PoE2 rectangle border"""
-        aspect_ratio = contour_data['aspect_ratio']
-        vertices = contour_data['vertices']
-        
-        # PoE2 aspect ratio confidence (bonus for exact matches)
-        matched_ratio = self.check_poe2_aspect_ratio(aspect_ratio)
-        if matched_ratio:
-            # Give high confidence for PoE2 ratio matches
-            aspect_confidence = 0.9 + (0.1 * (1 - self.aspect_ratio_tolerance))  # 0.9-1.0
-        else:
-            # Lower confidence for non-PoE2 ratios
-            aspect_confidence = 0.3
-        
-        # Vertex count confidence (exactly 4 vertices = perfect score)
-        vertex_confidence = 1.0 if vertices == 4 else 0.0
-        
-        # Combined confidence (focus on aspect ratio and vertices only)
-        confidence = (aspect_confidence * 0.7 + vertex_confidence * 0.3)
-        
-        return min(1.0, max(0.0, confidence))
-    
-    def is_rectangle_like(self, approx: np.ndarray, contour: np.ndarray) -> bool:
-        """Additional verification that the contour is rectangular-like"""
+    def is_rectangle_like(self, approx: np.ndarray, area: float, bbox: Tuple[int, int, int, int]) -> bool:
+        """Additional verification that the contour is rectangular-like. approx is its
+        polygon approximation; area and bbox are its area and bounding rectangle,
+        already computed by the caller."""
         try:
             # More lenient approach - just check basic rectangular properties
             if len(approx) >= 3:  # At least triangle
                 
                 # Calculate contour area vs bounding rectangle area
-                contour_area = cv2.contourArea(contour)
-                x, y, w, h = cv2.boundingRect(contour)
+                _, _, w, h = bbox
                 rect_area = w * h
                 
                 if rect_area > 0:
-                    area_ratio = contour_area / rect_area
+                    area_ratio = area / rect_area
                     
                     # For rectangular shapes, this ratio should be reasonable
                     if area_ratio < 0.3:  # Too irregular
@@ -118,26 +165,26 @@ class ItemDetector:
                 
                 # If we have 4+ vertices, do some basic angle checking
                 if len(approx) >= 4:
-                    # Check a few key angles (don't need to be perfect 90°)
-                    angles = []
-                    for i in range(min(4, len(approx))):  # Check first 4 angles
-                        p1 = approx[i][0]
-                        p2 = approx[(i + 1) % len(approx)][0]
-                        p3 = approx[(i + 2) % len(approx)][0]
-                        
-                        # Calculate angle at p2
-                        v1 = p1 - p2
-                        v2 = p3 - p2
-                        
-                        if np.linalg.norm(v1) > 0 and np.linalg.norm(v2) > 0:
-                            cos_angle = np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2))
-                            cos_angle = np.clip(cos_angle, -1.0, 1.0)
-                            angle = np.arccos(cos_angle) * 180 / np.pi
-                            angles.append(angle)
+                    # Check a few key angles (don't need to be perfect 90°),
+                    # all at once: the angle at p2 between p1 and p3 for the
+                    # first 4 consecutive vertex triples
+                    points = approx[:, 0, :].astype(np.float64)
+                    idx = np.arange(min(4, len(points)))
+                    p1 = points[idx]
+                    p2 = points[(idx + 1) % len(points)]
+                    p3 = points[(idx + 2) % len(points)]
+                    v1 = p1 - p2
+                    v2 = p3 - p2
+                    
+                    norms1 = np.sqrt((v1 * v1).sum(axis=1))
+                    norms2 = np.sqrt((v2 * v2).sum(axis=1))
+                    valid = (norms1 > 0) & (norms2 > 0)
+                    cos_angles = (v1 * v2).sum(axis=1)[valid] / (norms1[valid] * norms2[valid])
+                    angles = np.arccos(np.clip(cos_angles, -1.0, 1.0)) * 180 / np.pi
                     
                     if len(angles) > 0:
                         # Check if angles are reasonable (not too acute or obtuse)
-                        extreme_angles = [a for a in angles if a < 45 or a > 135]
+                        extreme_angles = angles[(angles < 45) | (angles > 135)]
                         if len(extreme_angles) > len(angles) * 0.5:  # More than half are extreme
                             return False
             
@@ -146,19 +193,33 @@ class ItemDetector:
         except Exception:
             return False
 
-    def capture_screen_region(self, window_bounds: Dict) -> Optional[np.ndarray]:
-        """Capture a specific region of the screen using pyautogui (same as V5 standalone)"""
+    def capture_screen_region(self, window_bounds: Dict, reuse_buffer: bool = True) -> Optional[np.ndarray]:
+        """Capture a specific region of the screen using mss. With reuse_buffer the
+        frame is written into a per-thread buffer that the next capture overwrites."""
         try:
-            # Use pyautogui.screenshot() like the standalone V5 script
-            screenshot = pyautogui.screenshot(region=(
-                window_bounds['x'], 
-                window_bounds['y'], 
-                window_bounds['width'], 
-                window_bounds['height']
-            ))
-            
-            # Convert PIL to OpenCV format (same as V5 standalone)
-            image = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
+            local = self._capture_local
+            if getattr(local, 'sct', None) is None:
+                local.sct = mss.mss()
+                local.bgr_buf = None
+            
+            monitor = {
+                'left': window_bounds['x'],
+                'top': window_bounds['y'],
+                'width': window_bounds['width'],
+                'height': window_bounds['height']
+            }
+            screenshot = local.sct.grab(monitor)
+            
+            # View the raw BGRA pixels without copying them, then drop alpha
+            # (into a buffer reused across captures on this thread if allowed)
+            height, width = screenshot.height, screenshot.width
+            bgra = np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(height, width, 4)
+            if not reuse_buffer:
+                image = cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR)
+            else:
+                if local.bgr_buf is None or local.bgr_buf.shape[:2] != (height, width):
+                    local.bgr_buf = np.empty((height, width, 3), dtype=np.uint8)
+                image = cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=local.bgr_buf)
             
             logger.info(f"Screenshot captured: {image.shape} at ({window_bounds['x']}, {window_bounds['y']}) {window_bounds['width']}x{window_bounds['height']}")
             
@@ -171,49 +232,78 @@ class ItemDetector:
     def detect_purple_borders(self, image: np.ndarray) -> List[Dict]:
         """Detect purple-bordered items using V5 PoE2-optimized algorithm"""
         try:
-            # Log current configuration
-            logger.info(f"V5 Detection config: confidence={self.config.get('confidence_threshold', 0.4)}, min_area={self.config.get('min_area', 300)}, max_area={self.config.get('max_area', 100000)}")
+            local = self._capture_local
+            if getattr(local, 'hsv_buf', None) is None or local.hsv_buf.shape[:2] != image.shape[:2]:
+                local.hsv_buf = np.empty(image.shape[:2] + (3,), dtype=np.uint8)
+                local.mask_buf = np.empty(image.shape[:2], dtype=np.uint8)
+            
             # Convert to HSV for better color detection
-            hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+            hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV, dst=local.hsv_buf)
             
             # V5 Purple color range (from reference app)
-            purple_mask = cv2.inRange(hsv, self.purple_lower, self.purple_upper)
-            
-            # Apply gentle morphological operations
-            kernel = np.ones((2, 2), np.uint8)
-            purple_mask = cv2.morphologyEx(purple_mask, cv2.MORPH_CLOSE, kernel)
+            purple_mask = cv2.inRange(hsv, self.purple_lower, self.purple_upper, dst=local.mask_buf)
+            
+            # Filter by area (use config values)
+            min_area = self._min_area
+            max_area = self._max_area
+            
+            # Frames without any purple pixel (e.g. while the merchant window is
+            # changing) have nothing to close or trace
+            if not mask_has_pixels(purple_mask):
+                regions = []
+            else:
+                # Apply gentle morphological operations
+                purple_mask = cv2.morphologyEx(purple_mask, cv2.MORPH_CLOSE, self._kernel, dst=purple_mask)
+                
+                # A coarse pass at half resolution finds the regions that can hold a
+                # contour of min_area, so only those are traced. On dense masks the
+                # pooled noise joins into one region anyway, so trace it all at once.
+                if cv2.countNonZero(purple_mask) * 10 > purple_mask.size:
+                    regions = [(0, 0, purple_mask.shape[1], purple_mask.shape[0])]
+                else:
+                    regions = find_candidate_regions(purple_mask, min_area)
             
             # Find contours
-            contours, _ = cv2.findContours(purple_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            logger.info(f"Found {len(contours)} raw contours")
+            contours = []
+            for x, y, w, h in regions:
+                # Only trace the components that can reach min_area
+                candidates = drop_components_below(purple_mask[y:y + h, x:x + w], min_area)
+                region_contours, _ = cv2.findContours(candidates, cv2.RETR_EXTERNAL,
+                                                      cv2.CHAIN_APPROX_SIMPLE, offset=(x, y))
+                contours.extend(region_contours)
             
-            # Debug: count purple pixels
-            purple_pixel_count = cv2.countNonZero(purple_mask)
-            logger.info(f"Purple pixels detected: {purple_pixel_count}")
+            # Restore the whole-mask findContours order (descending start point)
+            if len(regions) > 1:
+                contours.sort(key=lambda c: (int(c[0, 0, 1]), int(c[0, 0, 0])), reverse=True)
+            
+            logger.info(f"Found {len(contours)} candidate contours")
+            
+            # Per-contour diagnostics are only formatted when DEBUG logging is on
+            debug = logger.isEnabledFor(logging.DEBUG)
             
-            rectangle_contours = []
+            # Debug: count purple pixels
+            if debug:
+                purple_pixel_count = cv2.countNonZero(purple_mask)
+                logger.debug(f"Purple pixels detected: {purple_pixel_count}")
+            
+            # Surviving contours as parallel lists (bbox, area, aspect ratio,
+            # vertex count, matched ratio name)
+            bboxes = []
+            areas = []
+            aspect_ratios = []
+            vertex_counts = []
+            matched_ratios = []
             
             for i, contour in enumerate(contours):
                 area = cv2.contourArea(contour)
                 
-                # Filter by area (use config values)
-                min_area = self.config.get('min_area', 300)
-                max_area = self.config.get('max_area', 100000)
                 if area < min_area or area > max_area:
-                    logger.info(f"Contour {i}: Area {area:.0f} outside range [{min_area}, {max_area}]")
+                    if debug:
+                        logger.debug(f"Contour {i}: Area {area:.0f} outside range [{min_area}, {max_area}]")
                     continue
                 
-                # Approximate the contour to a polygon
-                epsilon = self.epsilon_factor * cv2.arcLength(contour, True)
-                approx = cv2.approxPolyDP(contour, epsilon, True)
-                
-                # Check if it's exactly 4 vertices (rectangular)
-                num_vertices = len(approx)
-                if num_vertices != 4:
-                    logger.info(f"Contour {i}: {num_vertices} vertices (need exactly 4 for rectangles)")
-                    continue
-                
-                # Get bounding rectangle
+                # Get bounding rectangle (cheap) and reject by aspect ratio before
+                # running the polygon approximation
                 x, y, w, h = cv2.boundingRect(contour)
                 
                 # Calculate aspect ratio and check if it matches PoE2 item border ratios
@@ -221,74 +311,87 @@ class ItemDetector:
                 matched_ratio = self.check_poe2_aspect_ratio(aspect_ratio)
                 
                 if not matched_ratio:
-                    logger.info(f"Contour {i}: Aspect ratio {aspect_ratio:.3f} doesn't match PoE2 item ratios")
+                    if debug:
+                        logger.debug(f"Contour {i}: Aspect ratio {aspect_ratio:.3f} doesn't match PoE2 item ratios")
+                    continue
+                
+                # Approximate the contour to a polygon
+                epsilon = self.epsilon_factor * cv2.arcLength(contour, True)
+                approx = cv2.approxPolyDP(contour, epsilon, True)
+                
+                # Check if it's exactly 4 vertices (rectangular)
+                # _rectangle_confidence assumes exactly 4 vertices and a matched ratio;
+                # update it if this check changes
+                num_vertices = len(approx)
+                if num_vertices != 4:
+                    if debug:
+                        logger.debug(f"Contour {i}: {num_vertices} vertices (need exactly 4 for rectangles)")
                     continue
                 
                 # Additional rectangle verification
-                if self.is_rectangle_like(approx, contour):
-                    rectangle_contours.append({
-                        'contour': contour,
-                        'approx': approx,
-                        'area': area,
-                        'bbox': (x, y, w, h),
-                        'aspect_ratio': aspect_ratio,
-                        'vertices': num_vertices,
-                        'matched_ratio': matched_ratio
-                    })
+                if self.is_rectangle_like(approx, area, (x, y, w, h)):
+                    bboxes.append((x, y, w, h))
+                    areas.append(area)
+                    aspect_ratios.append(aspect_ratio)
+                    vertex_counts.append(num_vertices)
+                    matched_ratios.append(matched_ratio)
                     
-                    logger.info(f"✅ Contour {i}: Rectangle-like! Area={area:.0f}, AR={aspect_ratio:.3f}, Vertices={num_vertices}, Type={matched_ratio}")
-                else:
-                    logger.info(f"❌ Contour {i}: FAILED rectangle-like verification")
-            
-            # Calculate confidence and filter
+                    if debug:
+                        logger.debug(f"Contour {i}: Rectangle-like! Area={area:.0f}, AR={aspect_ratio:.3f}, Vertices={num_vertices}, Type={matched_ratio}")
+                elif debug:
+                    logger.debug(f"Contour {i}: FAILED rectangle-like verification")
+            
+            # Confidence is the same for every surviving contour (see __init__),
+            # so either all of them pass the threshold or none do. Sorting equal
+            # confidences keeps contour order, so no sort is needed.
+            confidence = self._rectangle_confidence
+            if confidence < self._confidence_threshold:
+                bboxes = []
+            
+            # Build result dicts only for the kept contours
             detected_items = []
-            for contour_data in rectangle_contours:
-                confidence = self.calculate_confidence(contour_data)
+            for k, (x, y, w, h) in enumerate(bboxes):
+                item = {
+                    'x': int(x),
+                    'y': int(y),
+                    'width': int(w),
+                    'height': int(h),
+                    'area': int(areas[k]),
+                    'confidence': confidence,
+                    'aspect_ratio': aspect_ratios[k],
+                    'vertices': vertex_counts[k],
+                    'item_type': matched_ratios[k],
+                    'center_x': int(x + w // 2),
+                    'center_y': int(y + h // 2)
+                }
                 
-                confidence_threshold = self.config.get('confidence_threshold', 0.4)
-                if confidence >= confidence_threshold:
-                    x, y, w, h = contour_data['bbox']
-                    
-                    item = {
-                        'x': int(x),
-                        'y': int(y),
-                        'width': int(w),
-                        'height': int(h),
-                        'area': int(contour_data['area']),
-                        'confidence': confidence,
-                        'aspect_ratio': contour_data['aspect_ratio'],
-                        'vertices': contour_data['vertices'],
-                        'item_type': contour_data['matched_ratio'],
-                        'center_x': int(x + w // 2),
-                        'center_y': int(y + h // 2)
-                    }
-                    
-                    detected_items.append(item)
-                    
-                    logger.info(f"✅ Detected {contour_data['matched_ratio']}: ({x + w//2}, {y + h//2}) - Confidence: {confidence:.2f}")
-            
-            # Sort by confidence
-            detected_items.sort(key=lambda x: x['confidence'], reverse=True)
+                detected_items.append(item)
+                
+                logger.info(f"✅ Detected {matched_ratios[k]}: ({x + w//2}, {y + h//2}) - Confidence: {confidence:.2f}")
             
             logger.info(f"🎯 V5 Detection complete: {len(detected_items)} PoE2 rectangle borders found")
             
-            # Save debug images for troubleshooting
-            try:
-                cv2.imwrite('debug_original.png', image)
-                cv2.imwrite('debug_mask.png', purple_mask)
-                
-                # Create overlay image showing detected rectangles
-                overlay = image.copy()
-                for item in detected_items:
-                    x, y, w, h = item['x'], item['y'], item['width'], item['height']
-                    cv2.rectangle(overlay, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                    cv2.putText(overlay, f"{item['confidence']:.2f}", (x, y - 10), 
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-                
-                cv2.imwrite('debug_overlay.png', overlay)
-                logger.info("Debug images saved: debug_original.png, debug_mask.png, debug_overlay.png")
-            except Exception as e:
-                logger.error(f"Failed to save debug images: {e}")
+            # Save debug images for troubleshooting (PNG encoding is slow, so only on request)
+            if self.config.get('debug_images', False):
+                try:
+                    cv2.imwrite('debug_original.png', image)
+                    cv2.imwrite('debug_mask.png', purple_mask)
+                    
+                    # Create overlay image showing detected rectangles
+                    if getattr(local, 'overlay_buf', None) is None or local.overlay_buf.shape != image.shape:
+                        local.overlay_buf = np.empty_like(image)
+                    overlay = local.overlay_buf
+                    np.copyto(overlay, image)
+                    for item in detected_items:
+                        x, y, w, h = item['x'], item['y'], item['width'], item['height']
+                        cv2.rectangle(overlay, (x, y), (x + w, y + h), (0, 255, 0), 2)
+                        cv2.putText(overlay, f"{item['confidence']:.2f}", (x, y - 10), 
+                                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+                    
+                    cv2.imwrite('debug_overlay.png', overlay)
+                    logger.info("Debug images saved: debug_original.png, debug_mask.png, debug_overlay.png")
+                except Exception as e:
+                    logger.error(f"Failed to save debug images: {e}")
             
             return detected_items
             
@@ -296,11 +399,12 @@ class ItemDetector:
             logger.error(f"Error in V5 purple border detection: {e}")
             return []
 
-    def detect_items(self, window_bounds: Dict) -> Dict:
-        """Main detection function"""
+    def detect_items(self, window_bounds: Dict, image: Optional[np.ndarray] = None) -> Dict:
+        """Main detection function (captures the window unless a frame is given)"""
         try:
             # Capture screen region
-            image = self.capture_screen_region(window_bounds)
+            if image is None:
+                image = self.capture_screen_region(window_bounds)
             if image is None:
                 return {
                     'success': False,
@@ -342,7 +446,6 @@ class ItemDetector:
             
             # Scale duration based on distance (longer moves take more time)
             # Add some randomness to make it more human-like
-            import random
             distance_factor = min(distance / 300, 1.5)  # Reduced distance factor impact
             random_factor = random.uniform(0.9, 1.1)  # Reduced randomness to ±10%
             duration = base_duration * distance_factor * random_factor
@@ -354,8 +457,9 @@ class ItemDetector:
             logger.info(f"Moving mouse from ({current_x}, {current_y}) to ({x}, {y}) with speed {mouse_speed} (duration: {duration:.3f}s, distance: {distance:.1f}px)")
             
             # Use PyAutoGUI's built-in easing for smoother movement
-            # PyAutoGUI uses a natural easing function by default
-            pyautogui.moveTo(x, y, duration=duration, tween=pyautogui.easeInOutQuad)
+            # PyAutoGUI uses a natural easing function by default. The random
+            # delays around the move replace PyAutoGUI's fixed PAUSE.
+            pyautogui.moveTo(x, y, duration=duration, tween=pyautogui.easeInOutQuad, _pause=False)
             
             # Add a small random delay after movement to simulate human reaction time
             post_delay = random.uniform(0.01, 0.03)  # Reduced delay
@@ -378,84 +482,6 @@ class ItemDetector:
                 'error': str(e)
             }
     
-    def click_mouse(self, x: int, y: int, modifiers: List[str] = ['ctrl']) -> Dict:
-        """Click mouse at specified coordinates with modifiers"""
-        try:
-            import pyautogui
-            import time
-            import random
-            
-            # Add a small random delay before clicking
-            pre_delay = random.uniform(0.05, 0.15)
-            time.sleep(pre_delay)
-            
-            # Press modifiers
-            for modifier in modifiers:
-                pyautogui.keyDown(modifier)
-            
-            # Perform the click
-            pyautogui.click(x, y)
-            
-            # Release modifiers
-            for modifier in modifiers:
-                pyautogui.keyUp(modifier)
-            
-            # Add a small random delay after clicking
-            post_delay = random.uniform(0.05, 0.15)
-            time.sleep(post_delay)
-            
-            logger.info(f"Clicked mouse at ({x}, {y}) with modifiers: {modifiers}")
-            
-            return {
-                'success': True,
-                'x': x,
-                'y': y,
-                'modifiers': modifiers,
-                'pre_delay': pre_delay,
-                'post_delay': post_delay
-            }
-            
-        except Exception as e:
-            logger.error(f"Mouse click failed: {e}")
-            return {
-                'success': False,
-                'error': str(e)
-            }
-    
-    def press_key(self, key: str) -> Dict:
-        """Press a key"""
-        try:
-            import pyautogui
-            import time
-            import random
-            
-            # Add a small random delay before pressing key
-            pre_delay = random.uniform(0.05, 0.15)
-            time.sleep(pre_delay)
-            
-            # Press the key
-            pyautogui.press(key)
-            
-            # Add a small random delay after pressing key
-            post_delay = random.uniform(0.05, 0.15)
-            time.sleep(post_delay)
-            
-            logger.info(f"Pressed key: {key}")
-            
-            return {
-                'success': True,
-                'key': key,
-                'pre_delay': pre_delay,
-                'post_delay': post_delay
-            }
-            
-        except Exception as e:
-            logger.error(f"Key press failed: {e}")
-            return {
-                'success': False,
-                'error': str(e)
-            }
-    
     def move_mouse_curved(self, x: int, y: int) -> Dict:
         """Move mouse with a curved path for even more natural movement"""
         try:
@@ -474,9 +500,6 @@ class ItemDetector:
                 return self.move_mouse(x, y)  # Use straight movement for short distances
             
             # Create a curved path with intermediate points
-            import random
-            import math
-            
             # Calculate midpoint with some random offset for natural curve
             mid_x = (current_x + x) / 2
             mid_y = (current_y + y) / 2
@@ -513,14 +536,16 @@ class ItemDetector:
             # Move through the curved path in two segments
             segment_duration = duration / 2
             
-            # First segment to midpoint
-            pyautogui.moveTo(int(mid_x), int(mid_y), duration=segment_duration, tween=pyautogui.easeInOutQuad)
+            # First segment to midpoint (the random delays replace PyAutoGUI's
+            # fixed PAUSE between and around the segments)
+            pyautogui.moveTo(int(mid_x), int(mid_y), duration=segment_duration, tween=pyautogui.easeInOutQuad,
+                             _pause=False)
             
             # Small pause at midpoint (human-like hesitation)
             time.sleep(random.uniform(0.01, 0.03))
             
             # Second segment to final position
-            pyautogui.moveTo(x, y, duration=segment_duration, tween=pyautogui.easeInOutQuad)
+            pyautogui.moveTo(x, y, duration=segment_duration, tween=pyautogui.easeInOutQuad, _pause=False)
             
             # Post-delay
             post_delay = random.uniform(0.02, 0.08)
@@ -658,40 +683,89 @@ class ItemDetector:
         """Main detection loop"""
         start_time = time.time()
         
-        while not self.stop_detection:
-            try:
-                # Check timeout
-                if time.time() - start_time > self.config['detection_timeout'] / 1000:
-                    logger.info("Detection timeout reached")
-                    break
-                
-                # Perform detection
-                result = self.detect_items(self.config['detection_window'])
-                
-                if result['success'] and result['items']:
-                    # Send detection result
-                    logger.info(f"Sending detection result with {len(result['items'])} items")
-                    self._send_result('detection_result', {
-                        'items': result['items'],
-                        'confidence': result['confidence'],
-                        'timestamp': result['timestamp']
-                    })
-                    logger.info("Detection result sent successfully")
+        # Capture on a separate thread so grabbing the next frame overlaps
+        # detection on the current one
+        self._capture_stop.clear()
+        self._frame_ready.clear()
+        self._latest_frame = None
+        self._capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._capture_thread.start()
+        
+        try:
+            while not self.stop_detection:
+                try:
+                    # Check timeout
+                    if time.time() - start_time > self.config['detection_timeout'] / 1000:
+                        logger.info("Detection timeout reached")
+                        break
                     
-                    # Stop after finding an item
+                    # Wait for a frame newer than the last one detected on
+                    if not self._frame_ready.wait(timeout=0.1):
+                        continue
+                    with self._frame_lock:
+                        image = self._latest_frame
+                        self._frame_ready.clear()
+                    
+                    # Skip detection when the window has not changed since the last
+                    # frame, which found nothing (the loop stops once items are found)
+                    if self._is_repeated_frame(image):
+                        continue
+                    
+                    # Perform detection
+                    result = self.detect_items(self.config['detection_window'], image)
+                    
+                    if result['success'] and result['items']:
+                        # Send detection result
+                        logger.info(f"Sending detection result with {len(result['items'])} items")
+                        self._send_result('detection_result', {
+                            'items': result['items'],
+                            'confidence': result['confidence'],
+                            'timestamp': result['timestamp']
+                        })
+                        logger.info("Detection result sent successfully")
+                        
+                        # Stop after finding an item
+                        break
+                    
+                except Exception as e:
+                    logger.error(f"Error in detection loop: {e}")
+                    self._send_result('error', {'error': str(e)})
                     break
-                
-                # Wait before next detection
-                time.sleep(self.config['detection_interval'] / 1000.0)
-                
-            except Exception as e:
-                logger.error(f"Error in detection loop: {e}")
-                self._send_result('error', {'error': str(e)})
-                break
+        finally:
+            self._capture_stop.set()
+            self._capture_thread.join(timeout=2.0)
+            self._capture_thread = None
         
         self.is_detecting = False
         self._send_result('status', {'status': 'stopped', 'message': 'Detection completed'})
 
+    def _capture_loop(self):
+        """Background capture loop run alongside _detection_loop, publishing a
+        new frame every detection interval"""
+        try:
+            while not self._capture_stop.is_set():
+                # A fresh array per frame, so a published frame is never written
+                # again while the detection loop uses it
+                image = self.capture_screen_region(self.config['detection_window'], reuse_buffer=False)
+                if image is not None:
+                    with self._frame_lock:
+                        self._latest_frame = image
+                        self._frame_ready.set()
+                self._capture_stop.wait(self.config['detection_interval'] / 1000.0)
+        finally:
+            # This thread's mss instance is not reused once it exits
+            sct = getattr(self._capture_local, 'sct', None)
+            if sct is not None:
+                sct.close()
+                self._capture_local.sct = None
+
+    def _is_repeated_frame(self, image: np.ndarray) -> bool:
+        """Check if image matches the previous loop frame, then remember it
+        (loop frames are never written again, so no copy is kept)"""
+        previous = self._previous_frame
+        self._previous_frame = image
+        return previous is not None and previous.shape == image.shape and np.array_equal(previous, image)
+
     def _send_result(self, result_type: str, data: Dict):
         """Send result to main process"""
         result = {
@@ -700,9 +774,98 @@ class ItemDetector:
             **data
         }
         
-        # Print JSON to stdout for main process to read
-        print(json.dumps(result))
-        sys.stdout.flush()
+        # Write JSON to stdout for main process to read
+        send_message(result)
+
+def _handle_config(detector: ItemDetector, config: Dict) -> Dict:
+    config_data = config.get('config')
+    if config_data is not None:
+        detector.update_config(config_data)
+        # Only start continuous detection if this is for startDetection, not detectItems
+        # For one-time detection (detectItems), we just update config without starting detection loop
+        if config.get('startContinuousDetection', False):
+            detector.start_detection(detector.config)
+    else:
+        # If no config provided, just start with default config
+        detector.start_detection(detector.config)
+    
+    # Always send a response back for config commands
+    logger.info("Sending config response back to Node.js")
+    return {
+        'success': True,
+        'message': 'Configuration updated',
+        'startContinuousDetection': config.get('startContinuousDetection', False)
+    }
+
+def _handle_test(detector: ItemDetector, config: Dict) -> Dict:
+    # Simple test command to verify Python environment
+    return {
+        'success': True,
+        'message': 'Python environment test successful',
+        'timestamp': time.time()
+    }
+
+def _handle_detect(detector: ItemDetector, config: Dict) -> Dict:
+    logger.info("Received detect command")
+    # For one-time detection, use default config if not provided
+    window_bounds = config.get('windowBounds')
+    if not window_bounds or not isinstance(window_bounds, dict):
+        window_bounds = {
+            'x': 0, 'y': 0, 'width': 800, 'height': 600
+        }
+    
+    logger.info(f"Starting one-time detection with window bounds: {window_bounds}")
+    result = detector.detect_items(window_bounds)
+    logger.info(f"Detection completed, result: {result}")
+    return result
+
+def _handle_move_mouse(detector: ItemDetector, config: Dict) -> Dict:
+    # Choose movement type based on config
+    movement_type = detector.config.get('mouse_movement_type', 'natural')
+    if movement_type == 'curved':
+        return detector.move_mouse_curved(config.get('x', 0), config.get('y', 0))
+    return detector.move_mouse(config.get('x', 0), config.get('y', 0))
+
+def _handle_click_mouse(detector: ItemDetector, config: Dict) -> Dict:
+    return detector.click_mouse(config.get('x', 0), config.get('y', 0), config.get('modifiers', ['ctrl']))
+
+def _handle_press_key(detector: ItemDetector, config: Dict) -> Dict:
+    return detector.press_key(config.get('key', 'f5'))
+
+def _handle_click(detector: ItemDetector, config: Dict) -> Dict:
+    return detector.click_mouse(
+        config.get('x', 0), 
+        config.get('y', 0), 
+        config.get('modifiers', [])
+    )
+
+def _handle_key_press(detector: ItemDetector, config: Dict) -> Dict:
+    return detector.press_key(config.get('key', ''))
+
+def _handle_purchase(detector: ItemDetector, config: Dict) -> Dict:
+    return detector.purchase_item(config.get('itemBounds', {}))
+
+def _handle_capture(detector: ItemDetector, config: Dict) -> Dict:
+    # Just capture screen without detection
+    image = detector.capture_screen_region(config.get('windowBounds', {}))
+    return {
+        'success': image is not None,
+        'message': 'Screen captured' if image is not None else 'Failed to capture screen'
+    }
+
+# Command type -> handler taking (detector, command) and returning the reply
+COMMAND_HANDLERS = {
+    'config': _handle_config,
+    'test': _handle_test,
+    'detect': _handle_detect,
+    'move_mouse': _handle_move_mouse,
+    'click_mouse': _handle_click_mouse,
+    'press_key': _handle_press_key,
+    'click': _handle_click,
+    'key_press': _handle_key_press,
+    'purchase': _handle_purchase,
+    'capture': _handle_capture,
+}
 
 def main():
     """Main function for standalone execution"""
@@ -721,104 +884,17 @@ def main():
                 logger.info(f"Parsed config: {config}")
                 command_type = config.get('type') if config else None
                 
-                if command_type == 'config':
-                    config_data = config.get('config') if config else None
-                    if config_data is not None:
-                        detector.update_config(config_data)
-                        # Only start continuous detection if this is for startDetection, not detectItems
-                        # For one-time detection (detectItems), we just update config without starting detection loop
-                        if config.get('startContinuousDetection', False):
-                            detector.start_detection(detector.config)
-                    else:
-                        # If no config provided, just start with default config
-                        detector.start_detection(detector.config)
-                    
-                    # Always send a response back for config commands
-                    logger.info("Sending config response back to Node.js")
+                handler = COMMAND_HANDLERS.get(command_type)
+                if handler is None:
+                    logger.warning(f"Unknown command type: {command_type}")
                     result = {
-                        'success': True,
-                        'message': 'Configuration updated',
-                        'startContinuousDetection': config.get('startContinuousDetection', False)
+                        'success': False,
+                        'error': f'Unknown command type: {command_type}',
+                        'type': 'error'
                     }
-                    print(json.dumps(result))
-                    sys.stdout.flush()
-                    logger.info("Config response sent successfully")
-                    logger.info("Continuing to next input line...")
-                    
-                elif command_type == 'test':
-                    # Simple test command to verify Python environment
-                    result = {
-                        'success': True,
-                        'message': 'Python environment test successful',
-                        'timestamp': time.time()
-                    }
-                    print(json.dumps(result))
-                    sys.stdout.flush()
-                    
-                elif command_type == 'detect':
-                    logger.info("Received detect command")
-                    # For one-time detection, use default config if not provided
-                    window_bounds = config.get('windowBounds') if config else None
-                    if not window_bounds or not isinstance(window_bounds, dict):
-                        window_bounds = {
-                            'x': 0, 'y': 0, 'width': 800, 'height': 600
-                        }
-                    
-                    logger.info(f"Starting one-time detection with window bounds: {window_bounds}")
-                    result = detector.detect_items(window_bounds)
-                    logger.info(f"Detection completed, result: {result}")
-                    print(json.dumps(result))
-                    sys.stdout.flush()
-                    logger.info("Result sent to Node.js")
-                    
-                elif command_type == 'move_mouse':
-                    # Choose movement type based on config
-                    movement_type = detector.config.get('mouse_movement_type', 'natural')
-                    if movement_type == 'curved':
-                        result = detector.move_mouse_curved(config.get('x', 0), config.get('y', 0))
-                    else:
-                        result = detector.move_mouse(config.get('x', 0), config.get('y', 0))
-                    print(json.dumps(result))
-                    sys.stdout.flush()
-                    
-                elif command_type == 'click_mouse':
-                    result = detector.click_mouse(config.get('x', 0), config.get('y', 0), config.get('modifiers', ['ctrl']))
-                    print(json.dumps(result))
-                    sys.stdout.flush()
-                    
-                elif command_type == 'press_key':
-                    result = detector.press_key(config.get('key', 'f5'))
-                    print(json.dumps(result))
-                    sys.stdout.flush()
-                    
-                elif command_type == 'click':
-                    result = detector.click_mouse(
-                        config.get('x', 0), 
-                        config.get('y', 0), 
-                        config.get('modifiers', [])
-                    )
-                    print(json.dumps(result))
-                    sys.stdout.flush()
-                    
-                elif command_type == 'key_press':
-                    result = detector.press_key(config.get('key', ''))
-                    print(json.dumps(result))
-                    sys.stdout.flush()
-                    
-                elif command_type == 'purchase':
-                    result = detector.purchase_item(config.get('itemBounds', {}))
-                    print(json.dumps(result))
-                    sys.stdout.flush()
-                    
-                elif command_type == 'capture':
-                    # Just capture screen without detection
-                    image = detector.capture_screen_region(config.get('windowBounds', {}))
-                    result = {
-                        'success': image is not None,
-                        'message': 'Screen captured' if image is not None else 'Failed to capture screen'
-                    }
-                    print(json.dumps(result))
-                    sys.stdout.flush()
+                else:
+                    result = handler(detector, config)
+                send_message(result)
                     
             except json.JSONDecodeError as e:
                 logger.error(f"JSON decode error: {e}")
@@ -827,21 +903,18 @@ def main():
                     'error': f'Invalid JSON: {str(e)}',
                     'type': 'error'
                 }
-                print(json.dumps(error_result))
-                sys.stdout.flush()
+                send_message(error_result)
                 continue
             except Exception as e:
                 logger.error(f"Error processing input: {e}")
                 logger.error(f"Input line: {line}")
-                import traceback
                 logger.error(f"Traceback: {traceback.format_exc()}")
                 error_result = {
                     'success': False,
                     'error': str(e),
                     'type': 'error'
                 }
-                print(json.dumps(error_result))
-                sys.stdout.flush()
+                send_message(error_result)
                 break
             
     except KeyboardInterrupt:
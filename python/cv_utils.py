@@ -0,0 +1,104 @@
+"""
+Mask helpers shared by the border detection scripts
+"""
+
+import cv2
+import numpy as np
+
+def find_purple_roi(image, margin=4):
+    """
+    Find the bounding box (x, y, w, h) of the pixels that can be purple.
+    Purple hues all have green as their weakest channel, so min(B, R) > G is a
+    cheap BGR pre-filter that keeps every pixel the HSV purple ranges accept.
+    The box is padded by margin and None is returned if nothing qualifies.
+    """
+    b, g, r = cv2.split(image)[:3]
+    candidates = cv2.compare(cv2.min(b, r), g, cv2.CMP_GT)
+    x, y, w, h = cv2.boundingRect(candidates)
+    if w == 0 or h == 0:
+        return None
+    
+    height, width = image.shape[:2]
+    x0, y0 = max(x - margin, 0), max(y - margin, 0)
+    x1, y1 = min(x + w + margin, width), min(y + h + margin, height)
+    return x0, y0, x1 - x0, y1 - y0
+
+def label_components(mask):
+    """
+    Label the 8-connected components of a binary mask in a single pass.
+    Returns (labels, stats, outer): stats rows are (x, y, w, h, area) with the
+    background row removed, and outer marks (in a 1-pixel framed copy of the
+    mask) the background reachable from the image frame - what
+    cv2.RETR_EXTERNAL treats as "outside".
+    """
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    outer = cv2.copyMakeBorder(mask, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+    cv2.floodFill(outer, None, (0, 0), 128)
+    return labels, stats[1:], outer == 128
+
+def find_candidate_regions(mask, min_area):
+    """
+    Coarse pass over a 2x max-pooled copy of the mask. Every full-resolution
+    component lies inside one pooled component at most twice its size, so
+    pooled components too small to hold min_area are dropped and the rest are
+    merged into non-overlapping (x, y, w, h) regions of the mask. Anything that
+    could enclose a kept component is itself kept, so labelling or tracing each
+    region on its own gives the same components, nesting and external contours
+    as doing it on the whole mask.
+    """
+    height, width = mask.shape
+    padded = cv2.copyMakeBorder(mask, 0, height % 2, 0, width % 2, cv2.BORDER_CONSTANT, value=0)
+    # A 2x INTER_AREA downscale averages each 2x2 block, so it is non-zero iff any pixel is
+    small = cv2.resize(padded, (padded.shape[1] // 2, padded.shape[0] // 2), interpolation=cv2.INTER_AREA)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(small, connectivity=8)
+    stats = stats[1:]
+    keep = (2 * stats[:, 2] - 1) * (2 * stats[:, 3] - 1) >= min_area
+    boxes = [[2 * x, 2 * y, 2 * (x + w), 2 * (y + h)] for x, y, w, h in stats[keep, :4].tolist()]
+    
+    # Merge overlapping boxes until none overlap
+    merged = True
+    while merged:
+        merged = False
+        regions = []
+        for box in boxes:
+            for other in regions:
+                if box[0] < other[2] and other[0] < box[2] and box[1] < other[3] and other[1] < box[3]:
+                    other[:] = [min(box[0], other[0]), min(box[1], other[1]),
+                                max(box[2], other[2]), max(box[3], other[3])]
+                    merged = True
+                    break
+            else:
+                regions.append(box)
+        boxes = regions
+    
+    return [(x0, y0, min(x1, width) - x0, min(y1, height) - y0) for x0, y0, x1, y1 in boxes]
+
+def drop_components_below(mask, min_area):
+    """
+    Copy of a binary mask keeping only the 8-connected components whose
+    bounding box can enclose min_area. A contour traced through pixel centers
+    encloses at most (w-1)*(h-1), and anything such a component encloses is
+    smaller still, so external contours and nesting are unchanged for the
+    components that remain. The pixel count is no use here: a thin border
+    holds far fewer pixels than the area it encloses.
+    """
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    keep = ((stats[:, 2] - 1) * (stats[:, 3] - 1) >= min_area).astype(np.uint8) * 255
+    keep[0] = 0  # background
+    return keep[labels]
+
+def trace_external_contour(labels, outer, label, rect, offset=(0, 0)):
+    """
+    Trace the outer contour of one labelled component, or return None if it
+    sits inside a hole of another component (RETR_EXTERNAL would skip it).
+    """
+    x, y, w, h = rect
+    # The pixel above a component's first pixel is the background just outside it
+    first_x = x + int(np.argmax(labels[y, x:x + w] == label))
+    if not outer[y, first_x + 1]:
+        return None
+    
+    component = (labels[y:y + h, x:x + w] == label).view(np.uint8)
+    contours, _ = cv2.findContours(component, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE,
+                                   offset=(x + offset[0], y + offset[1]))
+    return contours[0]
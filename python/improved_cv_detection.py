@@ -10,29 +10,78 @@ import mss
 import json
 import sys
 import logging
+import os
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Define multiple HSV ranges for purple detection
+# Based on typical purple borders in PoE2 inventory
+PURPLE_RANGES = [(np.array(lower, np.uint8), np.array(upper, np.uint8), name) for lower, upper, name in [
+    # Standard purple ranges
+    ([120, 50, 50], [140, 255, 255], "blue_purple"),
+    ([140, 50, 50], [160, 255, 255], "purple"),
+    ([160, 50, 50], [180, 255, 255], "red_purple"),
+    
+    # More lenient ranges for different lighting/contrast
+    ([110, 30, 30], [150, 255, 255], "wide_purple"),
+    ([100, 20, 20], [180, 255, 255], "very_wide_purple"),
+    
+    # Bright purple ranges (for high contrast borders)
+    ([120, 100, 100], [160, 255, 255], "bright_purple"),
+    
+    # Dark purple ranges (for darker borders)
+    ([120, 20, 50], [160, 255, 150], "dark_purple")
+]]
+
+# "very_wide_purple" contains every other range, so their union is that range
+PURPLE_UNION_LOWER, PURPLE_UNION_UPPER, _ = PURPLE_RANGES[4]
+
+# Morphology kernels
+KERNEL_SMALL = np.ones((2, 2), np.uint8)
+KERNEL_MEDIUM = np.ones((3, 3), np.uint8)
+
 class ImprovedItemDetector:
+    # Frames are processed at 1/DOWNSCALE resolution and detections scaled back up.
+    # 2 makes every mask pass ~4x cheaper but lets small purple flecks grow into
+    # item-sized contours, so it is off by default.
+    DOWNSCALE = 1
+    
     def __init__(self):
-        self.sct = mss.mss()
+        # One mss handle for the detector's lifetime, opened on the first capture;
+        # creating it sets up the platform capture context, so capture_screen_region
+        # must not open one per call
+        self.sct = None
+        self._monitor = {"top": 0, "left": 0, "width": 0, "height": 0}
+        # Frame buffers reused across calls
+        self._bgr_buf = None
+        self._hsv_buf = None
+    
+    def __del__(self):
+        try:
+            self.sct.close()
+        except Exception:
+            pass
         
     def capture_screen_region(self, x, y, width, height):
-        """Capture a specific region of the screen"""
+        """Capture a specific region of the screen. The returned frame is
+        overwritten by the next capture."""
         try:
-            monitor = {
-                "top": y,
-                "left": x,
-                "width": width,
-                "height": height
-            }
+            if self.sct is None:
+                self.sct = mss.mss()
+            monitor = self._monitor
+            monitor["top"] = y
+            monitor["left"] = x
+            monitor["width"] = width
+            monitor["height"] = height
             screenshot = self.sct.grab(monitor)
-            img = np.array(screenshot)
-            # Convert from BGRA to BGR
-            img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-            return img
+            # View the raw BGRA pixels without copying them, then drop alpha
+            # into a buffer reused across captures
+            bgra = np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(screenshot.height, screenshot.width, 4)
+            if self._bgr_buf is None or self._bgr_buf.shape[:2] != bgra.shape[:2]:
+                self._bgr_buf = np.empty(bgra.shape[:2] + (3,), dtype=np.uint8)
+            return cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=self._bgr_buf)
         except Exception as e:
             logger.error(f"Failed to capture screen: {e}")
             return None
@@ -42,40 +91,28 @@ class ImprovedItemDetector:
         try:
             logger.info("Starting improved purple border detection")
             
+            # Per-range and per-contour messages are only built when DEBUG is enabled
+            log_debug = logger.isEnabledFor(logging.DEBUG)
+            
+            scale = self.DOWNSCALE
+            full_height, full_width = image.shape[:2]
+            if scale > 1:
+                image = cv2.resize(image, None, fx=1.0 / scale, fy=1.0 / scale, interpolation=cv2.INTER_AREA)
+            
             # Convert to HSV for better color detection
-            hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-            
-            # Define multiple HSV ranges for purple detection
-            # Based on typical purple borders in PoE2 inventory
-            purple_ranges = [
-                # Standard purple ranges
-                ([120, 50, 50], [140, 255, 255], "blue_purple"),
-                ([140, 50, 50], [160, 255, 255], "purple"),
-                ([160, 50, 50], [180, 255, 255], "red_purple"),
-                
-                # More lenient ranges for different lighting/contrast
-                ([110, 30, 30], [150, 255, 255], "wide_purple"),
-                ([100, 20, 20], [180, 255, 255], "very_wide_purple"),
-                
-                # Bright purple ranges (for high contrast borders)
-                ([120, 100, 100], [160, 255, 255], "bright_purple"),
-                
-                # Dark purple ranges (for darker borders)
-                ([120, 20, 50], [160, 255, 150], "dark_purple")
-            ]
+            if self._hsv_buf is None or self._hsv_buf.shape != image.shape:
+                self._hsv_buf = np.empty_like(image)
+            hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV, dst=self._hsv_buf)
             
             # Combine all purple masks
-            combined_mask = np.zeros(hsv.shape[:2], dtype=np.uint8)
-            total_pixels = 0
-            
-            for lower, upper, name in purple_ranges:
-                mask = cv2.inRange(hsv, np.array(lower), np.array(upper))
-                pixel_count = cv2.countNonZero(mask)
-                total_pixels += pixel_count
-                logger.info(f"{name}: {pixel_count} pixels")
-                
-                # Add to combined mask
-                combined_mask = cv2.bitwise_or(combined_mask, mask)
+            combined_mask = cv2.inRange(hsv, PURPLE_UNION_LOWER, PURPLE_UNION_UPPER)
+            total_pixels = cv2.countNonZero(combined_mask)
+            
+            # Per-range pixel counts cost one more pass each, so only when debugging
+            if log_debug:
+                for lower, upper, name in PURPLE_RANGES:
+                    pixel_count = cv2.countNonZero(cv2.inRange(hsv, lower, upper))
+                    logger.debug(f"{name}: {pixel_count} pixels")
             
             logger.info(f"Total purple pixels: {total_pixels}")
             
@@ -84,82 +121,81 @@ class ImprovedItemDetector:
                 return []
             
             # Apply morphological operations to clean up noise
-            kernel_small = np.ones((2, 2), np.uint8)
-            kernel_medium = np.ones((3, 3), np.uint8)
-            
             # Close small gaps in the mask
-            cleaned_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_CLOSE, kernel_small)
+            cleaned_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_CLOSE, KERNEL_SMALL)
             # Remove small noise
-            cleaned_mask = cv2.morphologyEx(cleaned_mask, cv2.MORPH_OPEN, kernel_medium)
+            cleaned_mask = cv2.morphologyEx(cleaned_mask, cv2.MORPH_OPEN, KERNEL_MEDIUM)
             
-            # Apply slight blur to smooth edges
-            cleaned_mask = cv2.GaussianBlur(cleaned_mask, (3, 3), 0)
+            # Grow the edges by one pixel. findContours treats any non-zero pixel
+            # as set, so this matches the old 3x3 GaussianBlur without the float pass.
+            cleaned_mask = cv2.dilate(cleaned_mask, KERNEL_MEDIUM)
             
             # Find contours
             contours, _ = cv2.findContours(cleaned_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
             logger.info(f"Found {len(contours)} contours")
             
+            # Skip very small contours (noise). Areas and rectangles are in
+            # full-resolution pixels so the thresholds do not depend on DOWNSCALE.
+            areas = np.fromiter((cv2.contourArea(c) for c in contours), np.float64, len(contours)) * (scale * scale)
+            candidates = np.flatnonzero(areas >= 50)
+            areas = areas[candidates]
+            
+            # Bounding rectangles of the remaining contours as an (N, 4) array
+            rects = np.array([cv2.boundingRect(contours[i]) for i in candidates], np.int64).reshape(-1, 4) * scale
+            if scale > 1:
+                # Odd frame sizes round up when downsampled, so clip to the frame
+                np.minimum(rects[:, 2], full_width - rects[:, 0], out=rects[:, 2])
+                np.minimum(rects[:, 3], full_height - rects[:, 1], out=rects[:, 3])
+            widths = rects[:, 2]
+            heights = rects[:, 3]
+            
+            # Calculate aspect ratio and how rectangular each contour is
+            aspect_ratios = widths / heights
+            rect_ratios = areas / (widths * heights)
+            
+            # Filter for item-like shapes
+            # Items in PoE2 inventory are typically roughly square/rectangular
+            keep = (aspect_ratios >= 0.3) & (aspect_ratios <= 3.0)  # Allow various aspect ratios
+            keep &= rect_ratios >= 0.4  # Should be reasonably rectangular
+            
+            # Calculate confidence based on multiple factors
+            area_scores = np.minimum(1.0, areas / 1000.0)  # Prefer larger areas
+            shape_scores = rect_ratios
+            aspect_scores = 1.0 - np.abs(aspect_ratios - 1.0) / 2.0  # Prefer square-ish
+            
+            confidences = (area_scores * 0.3 + shape_scores * 0.4 + aspect_scores * 0.3)
+            
+            # Accept items with reasonable confidence
+            keep &= confidences >= 0.3  # Lower threshold for testing
+            
+            if log_debug:
+                for j, i in enumerate(candidates):
+                    logger.debug(f"Contour {i}: area={areas[j]:.1f}, size=({widths[j]}x{heights[j]}), aspect={aspect_ratios[j]:.2f}, rect_ratio={rect_ratios[j]:.2f}, confidence={confidences[j]:.3f}, kept={bool(keep[j])}")
+            
+            # Sort by confidence. A stable argsort on the negated scores keeps
+            # ties in contour order, like list.sort(reverse=True) did.
+            kept = np.flatnonzero(keep)
+            kept = kept[np.argsort(-confidences[kept], kind='stable')]
+            
             detected_items = []
             
-            for i, contour in enumerate(contours):
-                area = cv2.contourArea(contour)
-                
-                # Skip very small contours (noise)
-                if area < 50:
-                    continue
-                
-                # Get bounding rectangle
-                x, y, w, h = cv2.boundingRect(contour)
-                
-                # Calculate aspect ratio
-                aspect_ratio = w / h
-                
-                # Calculate how rectangular the contour is
-                rect_area = w * h
-                contour_rect_ratio = area / rect_area if rect_area > 0 else 0
-                
-                logger.info(f"Contour {i}: area={area:.1f}, size=({w}x{h}), aspect={aspect_ratio:.2f}, rect_ratio={contour_rect_ratio:.2f}")
-                
-                # Filter for item-like shapes
-                # Items in PoE2 inventory are typically roughly square/rectangular
-                if not (0.3 <= aspect_ratio <= 3.0):  # Allow various aspect ratios
-                    logger.info(f"  -> Skipped (aspect ratio {aspect_ratio:.2f} not suitable)")
-                    continue
-                
-                if contour_rect_ratio < 0.4:  # Should be reasonably rectangular
-                    logger.info(f"  -> Skipped (not rectangular enough: {contour_rect_ratio:.2f})")
-                    continue
-                
-                # Calculate confidence based on multiple factors
-                area_score = min(1.0, area / 1000.0)  # Prefer larger areas
-                shape_score = contour_rect_ratio
-                aspect_score = 1.0 - abs(aspect_ratio - 1.0) / 2.0  # Prefer square-ish
-                
-                confidence = (area_score * 0.3 + shape_score * 0.4 + aspect_score * 0.3)
-                
-                logger.info(f"  -> Confidence: {confidence:.3f} (area={area_score:.3f}, shape={shape_score:.3f}, aspect={aspect_score:.3f})")
-                
-                # Accept items with reasonable confidence
-                if confidence >= 0.3:  # Lower threshold for testing
-                    item = {
-                        'x': int(x),
-                        'y': int(y),
-                        'width': int(w),
-                        'height': int(h),
-                        'area': int(area),
-                        'confidence': confidence,
-                        'aspect_ratio': aspect_ratio,
-                        'shape_score': contour_rect_ratio,
-                        'center_x': int(x + w // 2),
-                        'center_y': int(y + h // 2)
-                    }
-                    detected_items.append(item)
-                    logger.info(f"  -> DETECTED: {item}")
-                else:
-                    logger.info(f"  -> Rejected (confidence too low: {confidence:.3f})")
-            
-            # Sort by confidence
-            detected_items.sort(key=lambda x: x['confidence'], reverse=True)
+            for j in kept:
+                x, y, w, h = (int(v) for v in rects[j])
+                item = {
+                    'x': x,
+                    'y': y,
+                    'width': w,
+                    'height': h,
+                    'area': int(areas[j]),
+                    'confidence': float(confidences[j]),
+                    'aspect_ratio': float(aspect_ratios[j]),
+                    'shape_score': float(rect_ratios[j]),
+                    'center_x': x + w // 2,
+                    'center_y': y + h // 2
+                }
+                detected_items.append(item)
+                if log_debug:
+                    logger.debug(f"  -> DETECTED: {item}")
             
             logger.info(f"Final result: {len(detected_items)} items detected")
             return detected_items
@@ -170,6 +206,9 @@ class ImprovedItemDetector:
 
 def main():
     """Test the improved detection"""
+    # Leave half the cores to the game being captured
+    cv2.setNumThreads(max(1, (os.cpu_count() or 2) // 2))
+    
     detector = ImprovedItemDetector()
     
     # Default coordinates for 3440x1440 resolution
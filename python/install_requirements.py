@@ -7,10 +7,20 @@ import subprocess
 import sys
 import os
 
+PIP_INSTALL = [sys.executable, "-m", "pip", "install", "--disable-pip-version-check", "--prefer-binary"]
+
 def install_package(package):
     """Install a package using pip"""
     try:
-        subprocess.check_call([sys.executable, "-m", "pip", "install", package])
+        subprocess.check_call(PIP_INSTALL + [package])
+        return True
+    except subprocess.CalledProcessError:
+        return False
+
+def install_packages(packages):
+    """Install several packages with a single pip run"""
+    try:
+        subprocess.check_call(PIP_INSTALL + list(packages))
         return True
     except subprocess.CalledProcessError:
         return False
@@ -30,6 +40,16 @@ def main():
     
     failed_packages = []
     
+    # One pip run resolves and downloads everything together
+    print(f"Installing {', '.join(required_packages)}...")
+    if install_packages(required_packages):
+        print("=" * 60)
+        print("✓ All packages installed successfully!")
+        print("Computer vision functionality should now work.")
+        return True
+    
+    # Retry one at a time to find out which packages failed
+    print("✗ Combined install failed, retrying packages individually...")
     for package in required_packages:
         print(f"Installing {package}...", end=" ")
         if install_package(package):
@@ -55,6 +55,16 @@ def test_basic_cv():
         mask = cv2.inRange(hsv, np.array([120, 50, 50]), np.array([180, 255, 255]))
         print("✓ OpenCV color range detection working")
         
+        # Run the real detection pipeline on a drawn purple item border
+        from improved_cv_detection import ImprovedItemDetector
+        
+        cv2.rectangle(test_image, (20, 20), (70, 70), (220, 50, 180), 3)
+        items = ImprovedItemDetector().detect_purple_borders_improved(test_image)
+        if not items:
+            print("✗ Purple border detection found no items")
+            return False
+        print(f"✓ Purple border detection working - found {len(items)} item(s)")
+        
         return True
     except Exception as e:
         print(f"✗ OpenCV basic test failed: {e}")
@@ -9,43 +9,58 @@ import cv2
 import numpy as np
 import mss
 import logging
+import os
 import sys
+from cv_utils import drop_components_below
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Focus on the specific purple color of thin item borders
+# These are typically bright, saturated purples that form thin outlines
+PURPLE_RANGES = [(np.array(lower, np.uint8), np.array(upper, np.uint8)) for lower, upper in [
+    # Primary range - bright purple borders
+    ([130, 120, 120], [150, 255, 255]),
+    # Secondary range - slightly different purple shades
+    ([125, 100, 100], [155, 255, 255]),
+    # Backup range - darker purple borders
+    ([135, 80, 80], [145, 255, 255])
+]]
+
+# Very conservative 2x2 kernel to preserve thin borders
+KERNEL_SMALL = np.ones((2, 2), np.uint8)
+# Two 2x2 erosions in a row, as one 3x3 erosion anchored at the bottom-right
+KERNEL_DOUBLE_ERODE = np.ones((3, 3), np.uint8)
+DOUBLE_ERODE_ANCHOR = (2, 2)
+
+def find_candidate_contours(mask, min_area):
+    """External contours of mask that can enclose min_area, in findContours order"""
+    contours, _ = cv2.findContours(drop_components_below(mask, min_area), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return contours
+
 def detect_thin_purple_borders(image, debug=True):
     """
     Detect thin purple borders around target items.
     Focus on the specific purple color and thickness of item borders.
     """
+    # Per-range and per-contour messages are only built when DEBUG is enabled
+    log_debug = logger.isEnabledFor(logging.DEBUG)
+    
     hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
     
-    # Focus on the specific purple color of thin item borders
-    # These are typically bright, saturated purples that form thin outlines
-    purple_ranges = [
-        # Primary range - bright purple borders
-        ([130, 120, 120], [150, 255, 255]),
-        # Secondary range - slightly different purple shades
-        ([125, 100, 100], [155, 255, 255]),
-        # Backup range - darker purple borders
-        ([135, 80, 80], [145, 255, 255])
-    ]
-    
-    combined_mask = np.zeros(hsv.shape[:2], dtype=np.uint8)
-    total_purple_pixels = 0
-    
-    for i, (lower, upper) in enumerate(purple_ranges):
-        lower = np.array(lower)
-        upper = np.array(upper)
-        mask = cv2.inRange(hsv, lower, upper)
-        
-        purple_pixel_count = np.sum(mask > 0)
-        logger.info(f"Purple range {i+1}: {purple_pixel_count} pixels")
-        total_purple_pixels += purple_pixel_count
-        
-        combined_mask = cv2.bitwise_or(combined_mask, mask)
+    # The primary range lies inside the secondary one, so the union of all
+    # three is the secondary range plus the backup range
+    combined_mask = cv2.inRange(hsv, *PURPLE_RANGES[1])
+    backup_mask = cv2.inRange(hsv, *PURPLE_RANGES[2])
+    combined_mask = cv2.bitwise_or(combined_mask, backup_mask, dst=combined_mask)
+    total_purple_pixels = cv2.countNonZero(combined_mask)
+    
+    # Per-range pixel counts cost one more pass each, so only when debugging
+    if log_debug:
+        for i, (lower, upper) in enumerate(PURPLE_RANGES):
+            purple_pixel_count = cv2.countNonZero(cv2.inRange(hsv, lower, upper))
+            logger.debug(f"Purple range {i+1}: {purple_pixel_count} pixels")
     
     logger.info(f"Total purple pixels: {total_purple_pixels}")
     
@@ -54,142 +69,119 @@ def detect_thin_purple_borders(image, debug=True):
         return [], combined_mask
     
     # Additional step: try to isolate border-like structures
-    # Apply edge detection to find border-like patterns
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    edges = cv2.Canny(gray, 50, 150)
-    
-    # Combine purple mask with edge information
-    # This helps identify purple pixels that are actually on edges/borders
-    border_candidates = cv2.bitwise_and(combined_mask, edges)
-    border_pixel_count = np.sum(border_candidates > 0)
-    logger.info(f"Purple pixels on edges: {border_pixel_count}")
-    
-    # Use border candidates if we have enough, otherwise fall back to full mask
-    if border_pixel_count > 50:
-        logger.info("Using edge-enhanced mask for border detection")
-        working_mask = border_candidates
-    else:
-        logger.info("Using full purple mask (not enough edge pixels)")
-        working_mask = combined_mask
+    # The morphological gradient of the purple mask is the outline of the
+    # purple regions, which is what a thin border looks like
+    working_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_GRADIENT, KERNEL_SMALL)
+    logger.info("Using purple mask outline for border detection")
     
     # Very conservative morphological operations to preserve thin borders
     # Only do minimal cleanup to avoid losing the actual border pixels
-    kernel_small = np.ones((2, 2), np.uint8)
     
-    # Just close tiny gaps, don't be aggressive
-    cleaned_mask = cv2.morphologyEx(working_mask, cv2.MORPH_CLOSE, kernel_small)
-    
-    # Remove only very small noise (single pixels)
-    kernel_tiny = np.ones((2, 2), np.uint8)
-    cleaned_mask = cv2.morphologyEx(cleaned_mask, cv2.MORPH_OPEN, kernel_tiny)
+    # Just close tiny gaps, don't be aggressive, then remove only very small
+    # noise (single pixels). Close then open is dilate, erode, erode, dilate;
+    # the back-to-back erosions run as one pass.
+    cleaned_mask = cv2.dilate(working_mask, KERNEL_SMALL)
+    cleaned_mask = cv2.erode(cleaned_mask, KERNEL_DOUBLE_ERODE, dst=cleaned_mask, anchor=DOUBLE_ERODE_ANCHOR)
+    cleaned_mask = cv2.dilate(cleaned_mask, KERNEL_SMALL, dst=cleaned_mask)
     
     # Count pixels after cleaning
-    cleaned_pixel_count = np.sum(cleaned_mask > 0)
+    cleaned_pixel_count = cv2.countNonZero(cleaned_mask)
     logger.info(f"Purple pixels after cleaning: {cleaned_pixel_count}")
     
-    # Find contours
-    contours, _ = cv2.findContours(cleaned_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    logger.info(f"Found {len(contours)} contours after cleaning")
-    
-    # If no contours found after cleaning, try with the raw working mask
-    if len(contours) == 0:
+    # Find contours, leaving out blobs too small to pass the area filter
+    # If cleaning left nothing at all, try with the raw working mask
+    if cleaned_pixel_count > 0:
+        contours = find_candidate_contours(cleaned_mask, 30)
+        logger.info(f"Found {len(contours)} contours after cleaning")
+    else:
         logger.info("No contours found after cleaning, trying with raw working mask...")
-        contours, _ = cv2.findContours(working_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        contours = find_candidate_contours(working_mask, 30)
         logger.info(f"Found {len(contours)} contours in raw working mask")
     
+    # Skip very small contours (noise)
+    areas = np.fromiter((cv2.contourArea(c) for c in contours), np.float64, len(contours))
+    candidates = np.flatnonzero(areas >= 30)
+    areas = areas[candidates]
+    
+    # Bounding rectangles of the remaining contours as an (N, 4) array
+    rects = np.array([cv2.boundingRect(contours[i]) for i in candidates], np.int64).reshape(-1, 4)
+    widths = rects[:, 2]
+    heights = rects[:, 3]
+    aspect_ratios = widths / heights
+    
+    # Calculate how rectangular each contour is
+    rect_areas = widths * heights
+    rect_ratios = areas / rect_areas
+    
+    # Filter for border-like structures (thin outlines) with the cheap
+    # bounding-box tests first
+    # Borders should have relatively low area compared to their bounding box
+    keep = rect_ratios <= 0.6  # Skip filled areas (high rect_ratio = mostly filled)
+    # A true border should not fill most of its bounding rectangle
+    keep &= areas <= rect_areas * 0.7  # Skip if area is more than 70% of bounding box
+    # Items in PoE2 inventory are typically roughly square/rectangular
+    keep &= (aspect_ratios >= 0.3) & (aspect_ratios <= 3.0)  # Allow various aspect ratios
+    keep &= rect_ratios >= 0.1  # Should be reasonably rectangular (more lenient for borders)
+    
+    # Check if this looks like a border (thin outline) vs a filled item
+    # Borders should have low area-to-perimeter ratio. arcLength walks every
+    # contour point, so only measure the contours that are still in the running.
+    measured = np.flatnonzero(keep)
+    perimeters = np.zeros_like(areas)
+    perimeters[measured] = [cv2.arcLength(contours[candidates[j]], True) for j in measured]
+    area_perimeter_ratios = np.divide(areas, perimeters, out=np.zeros_like(areas), where=perimeters > 0)
+    # Borders should have reasonable area-to-perimeter ratio (not too thick)
+    keep &= area_perimeter_ratios <= 3.0  # Skip thick areas (more strict)
+    
+    # Calculate confidence based on border characteristics
+    area_scores = np.minimum(1.0, areas / 500.0)  # Prefer reasonable sized areas
+    
+    # Border score: lower area_perimeter_ratio is better for borders
+    border_scores = np.maximum(0.0, 1.0 - (area_perimeter_ratios / 5.0))  # Score decreases as ratio increases
+    
+    # Shape score: prefer rectangular borders but not too filled
+    shape_scores = np.minimum(rect_ratios * 2.0, 1.0)  # Cap at 1.0, favor lower ratios
+    
+    aspect_scores = 1.0 - np.abs(aspect_ratios - 1.0) / 2.0  # Prefer square-ish
+    
+    confidences = (area_scores * 0.2 + border_scores * 0.4 + shape_scores * 0.2 + aspect_scores * 0.2)
+    
+    # Accept items with reasonable confidence
+    keep &= confidences >= 0.3  # Lower threshold for testing
+    
+    if log_debug:
+        for j, i in enumerate(candidates):
+            logger.debug(f"Contour {i}: area={areas[j]:.1f}, size=({widths[j]}x{heights[j]}), aspect={aspect_ratios[j]:.2f}, rect_ratio={rect_ratios[j]:.2f}, area/perim={area_perimeter_ratios[j]:.2f}, confidence={confidences[j]:.3f}, kept={bool(keep[j])}")
+    
     detected_items = []
     
-    for i, contour in enumerate(contours):
-        area = cv2.contourArea(contour)
-        
-        # Skip very small contours (noise)
-        if area < 30:
-            logger.info(f"Contour {i}: area={area:.1f} - too small, skipping")
-            continue
-        
-        # Get bounding rectangle
-        x, y, w, h = cv2.boundingRect(contour)
-        aspect_ratio = w / h
-        
-        # Calculate how rectangular the contour is
-        rect_area = w * h
-        contour_rect_ratio = area / rect_area if rect_area > 0 else 0
-        
-        # Check if this looks like a border (thin outline) vs a filled item
-        # Borders should have low area-to-perimeter ratio
-        perimeter = cv2.arcLength(contour, True)
-        if perimeter > 0:
-            area_perimeter_ratio = area / perimeter
-        else:
-            area_perimeter_ratio = 0
-        
-        logger.info(f"Contour {i}: area={area:.1f}, size=({w}x{h}), aspect={aspect_ratio:.2f}, rect_ratio={contour_rect_ratio:.2f}, area/perim={area_perimeter_ratio:.2f}")
-        
-        # Filter for border-like structures (thin outlines)
-        # Borders should have relatively low area compared to their bounding box
-        if contour_rect_ratio > 0.6:  # Skip filled areas (high rect_ratio = mostly filled)
-            logger.info(f"  -> Skipped (appears to be a filled item, not a border: rect_ratio={contour_rect_ratio:.2f})")
-            continue
-        
-        # Borders should have reasonable area-to-perimeter ratio (not too thick)
-        if area_perimeter_ratio > 3.0:  # Skip thick areas (more strict)
-            logger.info(f"  -> Skipped (too thick for a border: area/perim={area_perimeter_ratio:.2f})")
-            continue
-        
-        # Additional check: borders should be relatively small compared to their bounding box
-        # A true border should not fill most of its bounding rectangle
-        if area > (rect_area * 0.7):  # Skip if area is more than 70% of bounding box
-            logger.info(f"  -> Skipped (area too large for a border: {area:.0f} vs {rect_area:.0f})")
-            continue
-        
-        # Filter for item-like shapes
-        # Items in PoE2 inventory are typically roughly square/rectangular
-        if not (0.3 <= aspect_ratio <= 3.0):  # Allow various aspect ratios
-            logger.info(f"  -> Skipped (aspect ratio {aspect_ratio:.2f} not suitable)")
-            continue
-        
-        if contour_rect_ratio < 0.1:  # Should be reasonably rectangular (more lenient for borders)
-            logger.info(f"  -> Skipped (not rectangular enough: {contour_rect_ratio:.2f})")
-            continue
-        
-        # Calculate confidence based on border characteristics
-        area_score = min(1.0, area / 500.0)  # Prefer reasonable sized areas
-        
-        # Border score: lower area_perimeter_ratio is better for borders
-        border_score = max(0.0, 1.0 - (area_perimeter_ratio / 5.0))  # Score decreases as ratio increases
-        
-        # Shape score: prefer rectangular borders but not too filled
-        shape_score = min(contour_rect_ratio * 2.0, 1.0)  # Cap at 1.0, favor lower ratios
-        
-        aspect_score = 1.0 - abs(aspect_ratio - 1.0) / 2.0  # Prefer square-ish
-        
-        confidence = (area_score * 0.2 + border_score * 0.4 + shape_score * 0.2 + aspect_score * 0.2)
-        
-        logger.info(f"  -> Confidence: {confidence:.3f} (area={area_score:.3f}, border={border_score:.3f}, shape={shape_score:.3f}, aspect={aspect_score:.3f})")
-        
-        # Accept items with reasonable confidence
-        if confidence >= 0.3:  # Lower threshold for testing
-            detected_item = {
-                'x': x,
-                'y': y,
-                'width': w,
-                'height': h,
-                'area': area,
-                'confidence': confidence,
-                'aspect_ratio': aspect_ratio,
-                'shape_score': shape_score,
-                'center_x': x + w // 2,
-                'center_y': y + h // 2
-            }
-            detected_items.append(detected_item)
-            logger.info(f"  -> DETECTED: {detected_item}")
-        else:
-            logger.info(f"  -> Skipped (confidence {confidence:.3f} too low)")
+    for j in np.flatnonzero(keep):
+        x, y, w, h = (int(v) for v in rects[j])
+        detected_item = {
+            'x': x,
+            'y': y,
+            'width': w,
+            'height': h,
+            'area': float(areas[j]),
+            'confidence': float(confidences[j]),
+            'aspect_ratio': float(aspect_ratios[j]),
+            'shape_score': float(shape_scores[j]),
+            'center_x': x + w // 2,
+            'center_y': y + h // 2
+        }
+        detected_items.append(detected_item)
+        if log_debug:
+            logger.debug(f"  -> DETECTED: {detected_item}")
+    
+    logger.info(f"Final result: {len(detected_items)} items detected")
     
     return detected_items, cleaned_mask
 
 def main():
     """Test the thin border detection."""
+    # Leave half the cores to the game being captured
+    cv2.setNumThreads(max(1, (os.cpu_count() or 2) // 2))
+    
     # Use your merchant window coordinates
     x, y, width, height = 834, 284, 875, 867
     
@@ -199,8 +191,9 @@ def main():
     with mss.mss() as sct:
         monitor = {"top": y, "left": x, "width": width, "height": height}
         screenshot = sct.grab(monitor)
-        image = np.array(screenshot)
-        image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+        # View the raw BGRA pixels without copying them, then drop alpha
+        bgra = np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(screenshot.height, screenshot.width, 4)
+        image = cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR)
     
     logger.info(f"Screenshot captured: {image.shape}")
     
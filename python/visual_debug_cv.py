@@ -4,79 +4,158 @@ Visual debug script for computer vision detection
 Captures a screenshot and saves it for visual inspection
 """
 
+import argparse
 import cv2
 import numpy as np
 import mss
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    # DXGI Desktop Duplication capture, Windows only and optional
+    import bettercam
+except ImportError:
+    bettercam = None
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def capture_and_save_debug_images():
-    """Capture screenshot and save debug images"""
-    sct = mss.mss()
-    
+# Purple HSV ranges to visualise
+PURPLE_RANGES = [
+    ([120, 50, 50], [140, 255, 255], "blue_purple"),
+    ([140, 50, 50], [160, 255, 255], "purple"),
+    ([160, 50, 50], [180, 255, 255], "red_purple"),
+    ([110, 30, 30], [150, 255, 255], "wide_purple"),
+    ([100, 20, 20], [180, 255, 255], "very_wide_purple")
+]
+
+def _hue_lut(lower, upper):
+    """256-entry table that maps hues inside [lower, upper] to 255"""
+    lut = np.zeros(256, np.uint8)
+    lut[lower:upper + 1] = 255
+    return lut
+
+# Every range is open-ended at S=V=255 with the same S and V minimum, so
+# each mask is an H lookup AND a min(S, V) threshold
+PURPLE_MASKS = [(_hue_lut(lower[0], upper[0]), lower[1], name) for lower, upper, name in PURPLE_RANGES]
+
+MORPH_KERNEL = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+
+def capture_and_save_debug_images(ranges=None, save_colored=True, save_original=True, png_compression=None):
+    """Capture screenshot and save debug images. ranges limits the per-range
+    masks that are saved (default all); png_compression is the PNG level 0-9
+    (default OpenCV's own)."""
     # Default coordinates for 3440x1440 resolution
     x, y, width, height = 834, 284, 875, 867
     
     logger.info(f"Capturing screen region: x={x}, y={y}, width={width}, height={height}")
     
+    # The PNGs are independent and cv2.imwrite releases the GIL, so they are
+    # encoded on a pool while the next images are built. Nothing is modified
+    # after it is queued.
+    pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1))
+    writes = []
+    png_params = [] if png_compression is None else [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+    
+    def save(path, image):
+        writes.append((path, pool.submit(cv2.imwrite, path, image, png_params)))
+    
+    if ranges is None:
+        ranges = [name for _, _, name in PURPLE_MASKS]
+    
     try:
-        monitor = {
-            "top": y,
-            "left": x,
-            "width": width,
-            "height": height
-        }
-        screenshot = sct.grab(monitor)
-        img = np.array(screenshot)
-        # Convert from BGRA to BGR
-        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+        bgra = None
+        if bettercam is not None:
+            # Pulls the region straight from the desktop framebuffer instead of
+            # a GDI BitBlt
+            camera = bettercam.create(output_color="BGRA")
+            try:
+                bgra = camera.grab(region=(x, y, x + width, y + height))
+            finally:
+                camera.release()
+            if bgra is None:
+                logger.warning("bettercam returned no frame, falling back to mss")
+        
+        if bgra is None:
+            sct = mss.mss()
+            monitor = {
+                "top": y,
+                "left": x,
+                "width": width,
+                "height": height
+            }
+            screenshot = sct.grab(monitor)
+            # View the raw BGRA pixels without copying them
+            bgra = np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(screenshot.height, screenshot.width, 4)
+        
+        # Convert from BGRA to BGR for the saved and annotated images
+        img = cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR)
         
         # Save original image
-        cv2.imwrite('debug_original.png', img)
-        logger.info("Saved debug_original.png")
+        if save_original:
+            save('debug_original.png', img)
+            logger.info("Saved debug_original.png")
         
-        # Convert to HSV and save HSV image
-        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        cv2.imwrite('debug_hsv.png', hsv)
+        # Convert to HSV and save HSV image. BGR2HSV ignores the alpha
+        # channel, so this reads the capture directly.
+        hsv = cv2.cvtColor(bgra, cv2.COLOR_BGR2HSV)
+        save('debug_hsv.png', hsv)
         logger.info("Saved debug_hsv.png")
         
-        # Create and save purple masks
-        purple_ranges = [
-            ([120, 50, 50], [140, 255, 255], "blue_purple"),
-            ([140, 50, 50], [160, 255, 255], "purple"),
-            ([160, 50, 50], [180, 255, 255], "red_purple"),
-            ([110, 30, 30], [150, 255, 255], "wide_purple"),
-            ([100, 20, 20], [180, 255, 255], "very_wide_purple")
-        ]
+        # Create and save purple masks. Split the channels once, test H with
+        # each range's lookup table and share the S/V masks between ranges.
+        h, s, v = cv2.split(hsv)
+        min_sv = cv2.min(s, v, dst=s)
+        sv_masks = {}
+        hue_hists = {}
+        # Blank blue/green planes for the colored masks
+        zeros = np.zeros_like(h)
+        # Scratch buffer for the hue lookups. Every other image here is queued
+        # for writing, so it needs its own buffer.
+        hue_mask = np.empty_like(h)
         
-        for lower, upper, name in purple_ranges:
-            mask = cv2.inRange(hsv, np.array(lower), np.array(upper))
-            pixel_count = cv2.countNonZero(mask)
+        for i, (h_lut, sv_min, name) in enumerate(PURPLE_MASKS):
+            if sv_min not in sv_masks:
+                sv_masks[sv_min] = cv2.threshold(min_sv, sv_min - 1, 255, cv2.THRESH_BINARY)[1]
+                hue_hists[sv_min] = cv2.calcHist([h], [0], sv_masks[sv_min], [256], [0, 256]).ravel()
+            # The range's pixel count is the sum of its hue bins among the
+            # pixels that pass its S/V minimum
+            pixel_count = int(hue_hists[sv_min][h_lut > 0].sum())
             logger.info(f"{name}: {pixel_count} pixels")
             
+            # Only build the masks that are saved, plus the last one, which
+            # is reused as the combined mask below
+            if name not in ranges and i < len(PURPLE_MASKS) - 1:
+                continue
+            cv2.LUT(h, h_lut, dst=hue_mask)
+            mask = cv2.bitwise_and(hue_mask, sv_masks[sv_min])
+            if name not in ranges:
+                continue
+            
             # Save mask
-            cv2.imwrite(f'debug_mask_{name}.png', mask)
+            save(f'debug_mask_{name}.png', mask)
             
-            # Create colored version of the mask for better visualization
-            colored_mask = cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR)
-            colored_mask[:,:,0] = 0  # Remove blue
-            colored_mask[:,:,1] = 0  # Remove green
-            # Keep red channel for purple visualization
-            cv2.imwrite(f'debug_colored_{name}.png', colored_mask)
+            # Create colored version of the mask for better visualization,
+            # with the mask in the red channel only
+            if save_colored:
+                colored_mask = cv2.merge((zeros, zeros, mask))
+                save(f'debug_colored_{name}.png', colored_mask)
         
-        # Combine all masks
-        combined_mask = cv2.inRange(hsv, np.array([100, 20, 20]), np.array([180, 255, 255]))
-        cv2.imwrite('debug_combined_mask.png', combined_mask)
+        # Combine all masks. "very_wide_purple" contains every other range,
+        # so the union is the last mask built above.
+        combined_mask = mask
+        save('debug_combined_mask.png', combined_mask)
         
         # Apply morphological operations
-        kernel = np.ones((3, 3), np.uint8)
+        kernel = MORPH_KERNEL
         cleaned_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_CLOSE, kernel)
-        cleaned_mask = cv2.morphologyEx(cleaned_mask, cv2.MORPH_OPEN, kernel)
-        cleaned_mask = cv2.GaussianBlur(cleaned_mask, (3, 3), 0)
-        cv2.imwrite('debug_cleaned_mask.png', cleaned_mask)
+        cleaned_mask = cv2.morphologyEx(cleaned_mask, cv2.MORPH_OPEN, kernel, dst=cleaned_mask)
+        # Grow the edges by one pixel. findContours treats any non-zero pixel
+        # as set, so this gives the contours the old 3x3 GaussianBlur did.
+        cleaned_mask = cv2.dilate(cleaned_mask, kernel, dst=cleaned_mask)
+        save('debug_cleaned_mask.png', cleaned_mask)
         
         # Find and draw contours
         contours, _ = cv2.findContours(cleaned_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -85,24 +164,51 @@ def capture_and_save_debug_images():
         contour_img = img.copy()
         cv2.drawContours(contour_img, contours, -1, (0, 255, 0), 2)
         
-        # Draw bounding rectangles
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            if area > 100:  # Only draw significant contours
-                x, y, w, h = cv2.boundingRect(contour)
-                cv2.rectangle(contour_img, (x, y), (x + w, y + h), (255, 0, 0), 2)
-                
-                # Add text with area
-                cv2.putText(contour_img, f"{int(area)}", (x, y - 10), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+        # Draw bounding rectangles, only for significant contours
+        areas = np.fromiter((cv2.contourArea(c) for c in contours), np.float64, len(contours))
+        for i in np.flatnonzero(areas > 100):
+            x, y, w, h = cv2.boundingRect(contours[i])
+            cv2.rectangle(contour_img, (x, y), (x + w, y + h), (255, 0, 0), 2)
+            
+            # Add text with area
+            cv2.putText(contour_img, f"{int(areas[i])}", (x, y - 10), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
         
-        cv2.imwrite('debug_contours.png', contour_img)
+        save('debug_contours.png', contour_img)
         logger.info(f"Found {len(contours)} contours, saved debug_contours.png")
         
+        for path, write in writes:
+            if not write.result():
+                logger.error(f"Failed to write {path}")
+        
         logger.info("Debug images saved! Check the PNG files to see what's being detected.")
         
     except Exception as e:
         logger.error(f"Error capturing debug images: {e}")
+    finally:
+        pool.shutdown()
+
+def main():
+    """Parse the command line and save the requested debug images"""
+    range_names = [name for _, _, name in PURPLE_MASKS]
+    parser = argparse.ArgumentParser(description="Capture the detection region and save debug images")
+    parser.add_argument("--ranges", help=f"comma-separated ranges to save masks for (default: all of {','.join(range_names)})")
+    parser.add_argument("--no-colored", action="store_true", help="skip the red colored copies of the range masks")
+    parser.add_argument("--no-original", action="store_true", help="skip debug_original.png")
+    parser.add_argument("--png-compression", type=int, choices=range(10), metavar="N",
+                        help="PNG compression level 0-9 (default: OpenCV's)")
+    args = parser.parse_args()
+    
+    ranges = None
+    if args.ranges is not None:
+        ranges = [name.strip() for name in args.ranges.split(",") if name.strip()]
+        unknown = [name for name in ranges if name not in range_names]
+        if unknown:
+            parser.error(f"unknown range(s): {', '.join(unknown)}")
+    
+    capture_and_save_debug_images(ranges=ranges, save_colored=not args.no_colored,
+                                  save_original=not args.no_original,
+                                  png_compression=args.png_compression)
 
 if __name__ == "__main__":
-    capture_and_save_debug_images()
+    main()